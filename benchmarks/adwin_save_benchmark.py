@@ -0,0 +1,168 @@
+"""
+Benchmark of the ADwinGold2 (v6) acquisition hot path.
+
+Compares the CPU time per get_data / _save_data cycle of the former dict of
+lists path (array_mode=False) with the structured array path (array_mode=True)
+and the packed single FIFO process (packed_fifo=True), together with the number
+of ADwin calls and remote dgw.get_data reads per cycle. The compact row stores
+the timestamps as timebase records (compact_time=True), raw is the size of the
+adwin and timebase rows per cycle.
+No hardware or servers are needed: the FIFOs are served by a synthetic ADwin
+and the gateway pickles every appended array the way rpyc's obtain does, then
+converts it like HDF5FileInterface.append.
+
+usage:
+    python benchmarks/adwin_save_benchmark.py [sample_rate] [refresh_delay] [cycles]
+"""
+import sys
+import logging
+import pickle
+import ctypes
+from threading import Lock
+from time import process_time
+
+import numpy as np
+
+sys.path.append('C:\\Users\\BlueFors\\Documents\\p5control\\p5control-bluefors')
+
+from core.drivers_v2.adwingold2_v6 import ADwinGold2, CalibrationCache, compact_dtype
+from core.processing import DifferentialConductance, SweepSegmenter, SweepBinner, DigitalLockIn
+from core.processing import TimebaseEncoder, value_dtype, Pyramid
+
+
+class SyntheticADwin:
+    """Serves full FIFOs with `count` samples per cycle.
+
+    The time FIFO is accumulated in float32 like the Basic process does
+    (time = time + delta_t * takt), starting 100 s into a measurement.
+    """
+    def __init__(self, count, t_start=100.):
+        self.count = count
+        self.calls = 0
+        t = np.arange(count) / count
+        steps = np.full(count + 1, 1 / count, dtype='float32')
+        steps[0] = t_start
+        self.fifos = {
+            1: np.sin(2 * np.pi * t),
+            2: np.cos(2 * np.pi * t),
+            8: np.ones(count),
+            9: np.cumsum(steps, dtype='float32')[1:].astype('float64'),
+        }
+        # packed process: time, V1, V2, trigger per sample
+        self.fifos[10] = np.stack([self.fifos[i] for i in (9, 1, 2, 8)], axis=1).ravel()
+
+    def Fifo_Full(self, FifoNo):
+        self.calls += 1
+        return len(self.fifos[FifoNo])
+
+    def GetFifo_Double(self, FifoNo, Count):
+        self.calls += 1
+        buffer = (ctypes.c_double * Count)()
+        ctypes.memmove(buffer, self.fifos[FifoNo].ctypes.data, Count * 8)
+        return buffer
+
+
+class PickleGateway:
+    """Stands in for the DataGateway / DataServer pair."""
+    def __init__(self):
+        self.server_time = 0.0
+        self.reads = 0
+        self.nbytes = {}
+        self.status = {
+            '/status/femto': np.array([(10., 10.)], dtype=[('amp_A', '<f8'), ('amp_B', '<f8')]),
+            '/status/rref': np.array([(5.2e4,)], dtype=[('R_ref', '<f8')]),
+        }
+
+    def append(self, path, arr, **kwargs):
+        tic = process_time()
+        arr = pickle.loads(pickle.dumps(arr))
+        if isinstance(arr, dict):
+            val_type = type(next(iter(arr.values())))
+            if val_type == list:
+                dtype = np.dtype([(k, type(arr[k][0])) for k in arr])
+                arr = np.fromiter(zip(*[arr[k] for k in dtype.names]), dtype=dtype)
+        self.nbytes[path] = self.nbytes.get(path, 0) + getattr(arr, 'nbytes', 0)
+        self.server_time += process_time() - tic
+
+    def get_data(self, path, indices=(), field=None):
+        self.reads += 1
+        return self.status[path]
+
+
+def make_driver(count, array_mode, packed_fifo, compact_time=False):
+    adwin = ADwinGold2.__new__(ADwinGold2)
+    adwin._name = 'adwin'
+    adwin.lock = Lock()
+    adwin.inst = SyntheticADwin(count)
+    adwin.sample_rate = 5e4
+    adwin._time_offset = 0.0
+    adwin.output = True
+    adwin.amplitude = 1.0
+    adwin.calculating = True
+    adwin.current_threshold = 0
+    adwin.series_resistance = 0
+    adwin.V1_ovl = False
+    adwin.V2_ovl = False
+    adwin.array_mode = array_mode
+    adwin.packed_fifo = packed_fifo
+    adwin.calibration = CalibrationCache('adwinCalibration')
+    # the lists row is the baseline without the processing stages
+    adwin.differentiating = array_mode
+    adwin.didv = DifferentialConductance()
+    adwin.resistance_rows = 0
+    adwin.didv_rows = 0
+    adwin.segmenting = array_mode
+    adwin.segmenter = SweepSegmenter()
+    adwin.binning = array_mode
+    adwin.binner = SweepBinner()
+    adwin.locking = array_mode
+    adwin.lockin = DigitalLockIn()
+    adwin.buffered = False
+    adwin.buffer = None
+    adwin.stats = None
+    adwin.fifo_fill = 0.
+    adwin.chunk_size = 0
+    adwin.loop_time = 0.
+    adwin.current_refresh_delay = 0.
+    adwin.pyramiding = array_mode
+    adwin.pyramid = Pyramid(['V1', 'V2'])
+    # synthetic samples are 1/count apart
+    adwin.processor_rate = count
+    adwin.averaging = 1
+    adwin.compacting = compact_time
+    adwin.timebase = TimebaseEncoder()
+    adwin.compact_dtype = compact_dtype(value_dtype(adwin.averaging))
+    return adwin
+
+
+def run(count, cycles, array_mode, packed_fifo=False, compact_time=False):
+    adwin = make_driver(count, array_mode, packed_fifo, compact_time)
+    dgw = PickleGateway()
+    tic = process_time()
+    for _ in range(cycles):
+        data = adwin.get_data()
+        adwin._save_data('/measurement/benchmark', data, dgw)
+    total = (process_time() - tic) / cycles
+    server = dgw.server_time / cycles
+    raw = sum(n for path, n in dgw.nbytes.items() if path.endswith(('/adwin', '/timebase')))
+    return total - server, server, adwin.inst.calls / cycles, dgw.reads / cycles, raw / cycles
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+
+    sample_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 5e4
+    refresh_delay = float(sys.argv[2]) if len(sys.argv) > 2 else .5
+    cycles = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    count = int(sample_rate * refresh_delay)
+    print(f'{count} samples per cycle ({sample_rate:.0f} Hz, {refresh_delay} s), {cycles} cycles')
+    print(f'{"mode":<12}{"driver (ms)":>14}{"server (ms)":>14}{"total (ms)":>14}{"calls":>8}{"reads":>8}{"raw (kB)":>10}')
+    for name, array_mode, packed_fifo, compact_time in [
+            ('lists', False, False, False),
+            ('array', True, False, False),
+            ('packed', True, True, False),
+            ('compact', True, True, True),
+            ]:
+        driver, server, calls, reads, raw = run(count, cycles, array_mode, packed_fifo, compact_time)
+        print(f'{name:<12}{driver*1e3:>14.2f}{server*1e3:>14.2f}{(driver+server)*1e3:>14.2f}{calls:>8.0f}{reads:>8.1f}{raw/1e3:>10.0f}')
@@ -0,0 +1,66 @@
+"""
+Benchmark of the BlueForsWorker polling against the local API stand-in.
+
+Compares the former poll (requests.get of the full /values/ endpoint, new connection every time)
+with the worker poll through a keep-alive session asking for the subtrees of the keys, and with
+the fallback for an API without subtree requests. Reported are the wall time per poll cycle and
+the bytes received per cycle, one status poll (all status_keys) every ``status_every`` cycles.
+
+usage:
+    python benchmarks/bluefors_poll_benchmark.py [cycles] [status_every]
+"""
+import sys
+import logging
+from time import perf_counter
+
+import requests
+
+sys.path.append('C:\\Users\\BlueFors\\Documents\\p5control-bluefors')
+
+from core.drivers_v2.blueforsapi_v2 import BlueForsWorker, SAMPLE_KEY
+from core.utilities.bluefors_standin import BlueForsStandIn, TEMPERATURES, OTHERS
+
+KEYS = list(TEMPERATURES) + list(OTHERS)
+
+
+def run_former(url, cycles):
+    received = 0
+    tic = perf_counter()
+    for _ in range(cycles):
+        req = requests.get(url, timeout=3)
+        data = req.json()
+        _ = data['data'][SAMPLE_KEY]['content']['latest_value']
+        received += len(req.content)
+    return (perf_counter() - tic) / cycles, received / cycles
+
+
+def run_worker(url, cycles, status_every):
+    worker = BlueForsWorker('benchmark', url, keys=KEYS, delay=0)
+    tic = perf_counter()
+    for i in range(cycles):
+        # force a status poll every status_every cycles
+        worker._latest_status_poll = 0 if i % status_every == 0 else float('inf')
+        worker.poll()
+    worker.session.close()
+    return (perf_counter() - tic) / cycles, worker.received / cycles, worker.filtered
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    status_every = int(sys.argv[2]) if len(sys.argv) > 2 else 14
+
+    print(f"{'poll':<22}{'ms/cycle':>10}{'kB/cycle':>10}")
+    with_subtrees = BlueForsStandIn(subtrees=True).start()
+    without_subtrees = BlueForsStandIn(subtrees=False).start()
+    url = f"http://{with_subtrees.address}/values/"
+
+    t, b = run_former(url, cycles)
+    print(f"{'former get':<22}{t*1e3:>10.2f}{b/1e3:>10.1f}")
+    t, b, filtered = run_worker(url, cycles, status_every)
+    print(f"{'session, subtrees':<22}{t*1e3:>10.2f}{b/1e3:>10.1f}")
+    t, b, filtered = run_worker(f"http://{without_subtrees.address}/values/", cycles, status_every)
+    print(f"{'session, full':<22}{t*1e3:>10.2f}{b/1e3:>10.1f}")
+
+    with_subtrees.stop()
+    without_subtrees.stop()
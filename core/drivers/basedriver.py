@@ -1,17 +1,155 @@
 """Base Class for a driver, as an example using pyvisa
 """
 import logging
+import os
+import pickle
+import shutil
+import tempfile
 import threading
+import time
+from collections import deque
 
 import pyvisa
 
-from ..gateway import DataGateway
+from p5control.gateway import DataGateway
 
 logger = logging.getLogger(__name__)
 
 class BaseDriverError(Exception):
     """Exception related to the Driver"""
 
+class ChunkBuffer:
+    """Bounded FIFO of data chunks between the reading and the writing thread of a measurement.
+
+    If ``length`` chunks are waiting, ``put`` follows the overflow ``policy``:
+
+    - ``'block'``: wait until the writer took a chunk, no data is lost
+    - ``'drop_oldest'``: discard the oldest waiting chunk
+    - ``'spill'``: pickle the chunk to a temporary directory, the writer reads it back in order
+
+    Parameters
+    ----------
+    length : int
+        number of chunks held in memory
+    policy : str
+        'block', 'drop_oldest' or 'spill'
+    """
+    POLICIES = ('block', 'drop_oldest', 'spill')
+
+    def __init__(
+        self,
+        length: int = 16,
+        policy: str = 'block',
+    ):
+        if policy not in self.POLICIES:
+            raise BaseDriverError(f'unknown overflow policy "{policy}", use one of {self.POLICIES}.')
+        self.length = max(int(length), 1)
+        self.policy = policy
+
+        self.chunks = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # spilled chunks, always newer than the ones in memory
+        self.spill_dir = None
+        self.spilled = deque()
+        self.spill_count = 0
+
+        # backpressure metrics
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.spilled_total = 0
+        self.max_fill = 0
+        self.blocked_time = 0.
+        self.write_time = 0.
+
+        # exception of the writing thread
+        self.error = None
+
+    def put(self, chunk):
+        """Hand a chunk to the writer, called by the reading thread. None is skipped."""
+        if chunk is None:
+            return
+        with self.cond:
+            self.put_count += 1
+            if self.policy == 'block':
+                tic = time.perf_counter()
+                while len(self.chunks) >= self.length and not self.closed:
+                    self.cond.wait()
+                self.blocked_time += time.perf_counter() - tic
+            elif len(self.chunks) >= self.length or self.spilled:
+                if self.policy == 'drop_oldest':
+                    self.chunks.popleft()
+                    self.dropped += 1
+                else:
+                    self._spill(chunk)
+                    self.cond.notify_all()
+                    return
+            self.chunks.append(chunk)
+            self.max_fill = max(self.max_fill, self.fill())
+            self.cond.notify_all()
+
+    def get(self):
+        """Next chunk for the writing thread, None when closed and empty."""
+        with self.cond:
+            while not self.chunks and not self.spilled and not self.closed:
+                self.cond.wait()
+            if self.chunks:
+                chunk = self.chunks.popleft()
+            elif self.spilled:
+                chunk = self._unspill()
+            else:
+                return None
+            self.get_count += 1
+            self.cond.notify_all()
+            return chunk
+
+    def close(self):
+        """No more chunks will be put, the writer empties the buffer and stops."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def cleanup(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+    def fill(self):
+        """Number of waiting chunks, including spilled ones."""
+        return len(self.chunks) + len(self.spilled)
+
+    def stats(self):
+        """Backpressure metrics, e.g. for get_status."""
+        with self.cond:
+            return {
+                "buffer_fill": self.fill(),
+                "buffer_max_fill": self.max_fill,
+                "buffer_dropped": self.dropped,
+                "buffer_spilled": self.spilled_total,
+                "buffer_blocked_time": self.blocked_time,
+                "buffer_write_time": self.write_time,
+            }
+
+    def _spill(self, chunk):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='p5control_spill_')
+        filename = os.path.join(self.spill_dir, f'{self.spill_count:08d}.pickle')
+        self.spill_count += 1
+        with open(filename, 'wb') as f:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled.append(filename)
+        self.spilled_total += 1
+        self.max_fill = max(self.max_fill, self.fill())
+
+    def _unspill(self):
+        filename = self.spilled.popleft()
+        with open(filename, 'rb') as f:
+            chunk = pickle.load(f)
+        os.remove(filename)
+        return chunk
+
 class BaseDriver:
     """Base class for a driver. Implements some common funcionality for a message base driver with
     a given address.
@@ -26,6 +164,13 @@ class BaseDriver:
     https://github.com/pyvisa/pyvisa/issues/726. Thus it is necessary to think about thread safety.
     If you use a different library, make sure that it is thread safe or implement a driver-wide
     lock to stop weird behavior.
+
+    **Buffered measurement:**
+
+    Set the attribute ``buffered = True`` to read and save in different threads. The reading
+    thread only calls get_data() and puts the result into a ``ChunkBuffer``, a writing thread
+    calls _save_data(), so slow appends do not delay get_data(). ``buffer_length`` and
+    ``overflow_policy`` configure the buffer, its metrics are in ``self.buffer.stats()``.
     """
 
     def __init__(
@@ -50,7 +195,8 @@ class BaseDriver:
         address : str
             visa adress of the resource
         refresh_delay : float, default = 0.5
-            time spend asleep between self.get_data() calls in the measuremet thread
+            time spend asleep between self.get_data() calls in the measuremet thread, see
+            `_next_refresh_delay` to adapt it while measuring
         """
         self._name = name
         self._address = address
@@ -160,26 +306,32 @@ class BaseDriver:
         except NotImplementedError:
             logger.info('device "%s" does not implement start_measuring, skipped.', self._name)
 
-        # Measurement block
-        while not stop_event.wait(delay):
+        if getattr(self, 'buffered', False):
+            self._buffered_measuring(stop_event, delay, hdf5_path, dgw)
+        else:
+            # Measurement block
+            while not stop_event.wait(delay):
+
+                tic = time.perf_counter()
+                try:
+                    # get data and save it
+                    res = self.get_data()
+                    self._save_data(hdf5_path, res, dgw)
+
+                # this device cannot be measured
+                except NotImplementedError:
+                    logger.info(
+                        'device "%s" does not implement get_data, stopping measurement.', self._name)
+                    break
 
+                delay = self._next_refresh_delay(delay, time.perf_counter() - tic)
+
+            # save any remaining data
             try:
-                # get data and save it
                 res = self.get_data()
                 self._save_data(hdf5_path, res, dgw)
-
-            # this device cannot be measured
             except NotImplementedError:
-                logger.info(
-                    'device "%s" does not implement get_data, stopping measurement.', self._name)
-                break
-
-        # save any remaining data
-        try:
-            res = self.get_data()
-            self._save_data(hdf5_path, res, dgw)
-        except NotImplementedError:
-            pass
+                pass
 
         logger.info('stopping measurement of device "%s"', self._name)
 
@@ -195,6 +347,109 @@ class BaseDriver:
             exit_barrier.wait()
             logger.info('device "%s" released at exit_barrier', self._name)
 
+    def _buffered_measuring(
+        self,
+        stop_event: threading.Event,
+        delay: float,
+        hdf5_path: str,
+        dgw: DataGateway,
+    ):
+        """Measurement block of a buffered measurement. This thread reads, a writing thread
+        saves everything put into ``self.buffer``. Returns after all chunks are saved."""
+        self.buffer = ChunkBuffer(
+            length=getattr(self, 'buffer_length', 16),
+            policy=getattr(self, 'overflow_policy', 'block'),
+        )
+        writer = threading.Thread(
+            target=self._writing_thread,
+            args=(self.buffer, hdf5_path, dgw),
+            name=f'{self._name}_writer',
+            daemon=True,
+        )
+        writer.start()
+
+        try:
+            while not stop_event.wait(delay):
+
+                tic = time.perf_counter()
+                try:
+                    self.buffer.put(self.get_data())
+
+                # this device cannot be measured
+                except NotImplementedError:
+                    logger.info(
+                        'device "%s" does not implement get_data, stopping measurement.', self._name)
+                    break
+
+                # saving failed, stop like the unbuffered measurement
+                if self.buffer.error is not None:
+                    break
+
+                delay = self._next_refresh_delay(delay, time.perf_counter() - tic)
+
+            # save any remaining data
+            try:
+                if self.buffer.error is None:
+                    self.buffer.put(self.get_data())
+            except NotImplementedError:
+                pass
+        finally:
+            self.buffer.close()
+            writer.join()
+            self.buffer.cleanup()
+
+        logger.info('device "%s" buffer: %s', self._name, self.buffer.stats())
+        if self.buffer.error is not None:
+            raise self.buffer.error
+
+    def _writing_thread(
+        self,
+        buffer: ChunkBuffer,
+        hdf5_path: str,
+        dgw: DataGateway,
+    ):
+        """Saves the chunks of a buffered measurement until the buffer is closed and empty.
+        Stops at the first failed _save_data, the measuring thread raises its exception."""
+        while True:
+            res = buffer.get()
+            if res is None:
+                break
+            tic = time.perf_counter()
+            try:
+                self._save_data(hdf5_path, res, dgw)
+            except Exception as e:
+                logger.exception('device "%s" failed to save a chunk.', self._name)
+                buffer.error = e
+                # the reading thread must not wait on a full buffer
+                buffer.close()
+                break
+            finally:
+                buffer.write_time += time.perf_counter() - tic
+
+    def _next_refresh_delay(
+        self,
+        delay: float,
+        loop_time: float,
+    ):
+        """Return the time to wait before the next get_data() call of the measurement thread.
+        Called after every cycle with the current delay and the time the cycle spent in
+        get_data() and _save_data(). Overwrite this method to adapt the poll interval, e.g. to
+        the fill level of a hardware buffer.
+
+        Parameters
+        ----------
+        delay : float
+            delay used before the last cycle
+        loop_time : float
+            time in seconds spent in get_data() and _save_data()
+
+        Returns
+        -------
+        delay : float
+            delay before the next cycle, by default unchanged
+        """
+        return delay
+
     def _save_data(
         self,
         hdf5_path: str,
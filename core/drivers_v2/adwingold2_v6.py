@@ -2,8 +2,19 @@
 version v6:
 - adwin has now attribute ovls
 - adwin calculation enables R_TB
-
-- TODO calculate gradient
+- get_data returns one structured array (array_mode), no list copies
+- packed_fifo: adwingold2_v6_packed.TB0 writes one record per sample to FIFO 10
+- adaptive_delay: poll interval follows fifo fill and loop time (core.drivers.basedriver)
+- CalibrationCache: offset, femto and R_ref without remote reads per chunk
+- dIdV: streaming differential conductance per sweep segment (core.processing), one value per resistance row
+- startstop: start/stop/case index of the sweep segments next to the raw data
+- sweeps_up / sweeps_down: I binned over V per sweep on a lnspc grid, built while sweeping
+- lockin: software lock-in of V1 and V2 at a reference frequency, decimated
+- buffered: get_data and _save_data in separate threads (core.drivers.basedriver.ChunkBuffer)
+- compact_time: adwin without time column, (t0, dt, n) records in timebase, float32 V if possible
+- stats: min, max, mean, var and overload count per chunk, used for ovl and offsets
+- /status/adwin_acquisition: fifo fill, loop time, refresh delay, chunk stats, lock-in and buffer state per chunk
+- adwin_10x, adwin_100x, ...: min/max/mean levels of V1 and V2 for the viewer (core.plot.pyramid)
 '''
 
 import logging
@@ -14,9 +25,16 @@ import numpy as np
 from ADwin import ADwin
 from threading import Lock
 from time import sleep
+from collections import deque
+from rpyc.utils.classic import obtain
 
-from p5control.drivers.basedriver import BaseDriver
+from core.drivers.basedriver import BaseDriver, ChunkBuffer
 from p5control import DataGateway, InstrumentGateway
+from p5control.gateway.basegw import BaseGatewayError
+
+from core.processing import DifferentialConductance, SweepSegmenter, SweepBinner, DigitalLockIn
+from core.processing import TimebaseEncoder, value_dtype
+from core.processing import chunk_stats, Pyramid
 
 logger = logging.getLogger(__name__)
 
@@ -25,19 +43,208 @@ ADWIN_NAME = 'adwin'
 STATUS_NAME = 'status'
 OFFSET_NAME = 'offset'
 RESISTANCE_NAME = 'resistance'
+DIDV_NAME = 'dIdV'
+STARTSTOP_NAME = 'startstop'
+SWEEPS_UP_NAME = 'sweeps_up'
+SWEEPS_DOWN_NAME = 'sweeps_down'
+LOCKIN_NAME = 'lockin'
+TIMEBASE_NAME = 'timebase'
+STATS_NAME = 'stats'
+# /status/<name>_acquisition, drain and buffer metrics per chunk. They are not part of
+# get_status, a resumed file keeps the columns /status/<name> was created with.
+ACQUISITION_NAME = 'acquisition'
+# buffer columns of ACQUISITION_NAME while not buffering, same keys as ChunkBuffer.stats
+BUFFER_STATUS = {
+    "buffer_fill": 0,
+    "buffer_max_fill": 0,
+    "buffer_dropped": 0,
+    "buffer_spilled": 0,
+    "buffer_blocked_time": 0.,
+    "buffer_write_time": 0.,
+}
 
 FEMTO_NAME = 'femto'
 RREF_NAME = 'rref'
 
+# paths the status thread appends to, used for callbacks
+FEMTO_PATH = f"/{STATUS_NAME}/{FEMTO_NAME}"
+RREF_PATH = f"/{STATUS_NAME}/{RREF_NAME}"
+
+PROCESS_FILE = "external/adwingold2_v6.TB0"
+PACKED_PROCESS_FILE = "external/adwingold2_v6_packed.TB0"
+
+# packed process: FIFO 10 holds time, V1, V2, trigger per sample
+PACKED_FIFO = 10
+PACKED_WIDTH = 4
+
+# samples per FIFO (Buffersize in adwingold2_v6.bas)
+FIFO_LENGTH = 4000000
+# drain without waiting above this fill level
+FIFO_HIGH_WATER = .5
+
+# dtypes match the datasets created by the former dict of lists
+ADWIN_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('V1', '<f8'),
+    ('V2', '<f8'),
+    ('trigger', '<i8'),
+])
+RESISTANCE_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('G (G_0)', '<f8'),
+    ('R (Ohm)', '<f8'),
+    ('V (V)', '<f8'),
+    ('I (A)', '<f8'),
+])
+# compact_time: timestamps in TIMEBASE_NAME, see core.processing.timebase.timestamps
+def compact_dtype(value_dtype):
+    return np.dtype([
+        ('V1', value_dtype),
+        ('V2', value_dtype),
+        ('trigger', '<i4'),
+    ])
+# row k belongs to row k of RESISTANCE_NAME, NaN where dI/dV is not evaluated
+DIDV_DTYPE = np.dtype([
+    ('dI/dV (G_0)', '<f4'),
+])
+
+G_0 = 7.748e-5 # Siemens oder 1/Ohm
+
+class CalibrationCache:
+    """Holds the offsets, femto gains and R_ref used by the resistance calculation.
+
+    femto and rref are kept up to date by data server callbacks on their status datasets,
+    offsets are remembered when the driver saves them. Values older than ``ttl`` seconds
+    (e.g. no callback arrived) are read once from the data server as a fallback.
+    """
+    def __init__(self, name, ttl=10.):
+        logger.info('%s.__init__()', name)
+        self._name = name
+        self.ttl = ttl
+        self.lock = Lock()
+
+        self.dgw = None
+        # path -> (time, latest row or None)
+        self.values = {}
+        # offset path -> last two (V1_off, V2_off)
+        self.offsets = {}
+
+    def connect(self):
+        logger.info('%s.connect()', self._name)
+        if self.dgw is not None:
+            return
+        try:
+            self.dgw = DataGateway(allow_callback=True)
+            self.dgw.connect()
+            for path in [FEMTO_PATH, RREF_PATH]:
+                self.dgw.register_callback(
+                    path, 
+                    lambda arr, path=path: self._handle_callback(path, arr),
+                    )
+        except BaseGatewayError:
+            logger.warning('%s.connect() no callbacks, reading every %.0fs.', self._name, self.ttl)
+            self.dgw = None
+
+    def disconnect(self):
+        logger.info('%s.disconnect()', self._name)
+        if self.dgw is None:
+            return
+        # the data server drops callbacks of closed connections
+        self.dgw.disconnect()
+        self.dgw = None
+
+    def _handle_callback(self, path, arr):
+        arr = obtain(arr)
+        with self.lock:
+            self.values[path] = (time.time(), arr[-1])
+
+    def get(self, path, dgw):
+        """Latest row of the status dataset at path, None if there is none."""
+        with self.lock:
+            entry = self.values.get(path)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+
+        logger.debug('%s.get(%s) refreshing', self._name, path)
+        try:
+            data = dgw.get_data(path, indices=slice(-1, None, 1))
+            row = data[-1] if data.shape[0] > 0 else None
+        except KeyError:
+            row = None
+        with self.lock:
+            self.values[path] = (time.time(), row)
+        return row
+
+    def set_offset(self, path, V1_off, V2_off):
+        with self.lock:
+            if path not in self.offsets:
+                self.offsets[path] = deque(maxlen=2)
+            self.offsets[path].append((V1_off, V2_off))
+
+    def get_offset(self, path, dgw):
+        """Second to last offset saved at path, like ``slice(-2, -1)``, None if there is no
+        offset dataset."""
+        with self.lock:
+            offsets = self.offsets.get(path)
+            if offsets is not None:
+                return offsets[0] if len(offsets) == 2 else (0, 0)
+            entry = self.values.get(path)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return None
+
+        # saved before this driver started, read once
+        try:
+            data = dgw.get_data(path, indices=slice(-2, None, 1))
+        except KeyError:
+            with self.lock:
+                self.values[path] = (time.time(), None)
+            return None
+        for row in data:
+            self.set_offset(path, float(row['V1_off']), float(row['V2_off']))
+        return self.get_offset(path, dgw)
+
 class ADwinGold2(BaseDriver):
-    def __init__(self, name: str, series_resistance=0):
+    def __init__(
+            self, 
+            name: str, 
+            series_resistance=0,
+            packed_fifo: bool = False,
+            refresh_delay: float = .5,
+            adaptive_delay: bool = False,
+            ):
         logger.info('%s.__init__()', name)
         self._name = name
         self.version = 'v6'
         self.processor_rate = 2e5
+        self.packed_fifo = packed_fifo
 
-        self.refresh_delay = .5
+        self.refresh_delay = refresh_delay
         # Dont go too low with refresh_rate. Callbacks are waiting to long and get lost. original: .5, now .3, too low: .1
+        # With packed_fifo a cycle is one Fifo_Full and one GetFifo_Double, so lower values are affordable.
+
+        # adaptive_delay: wait until about target_chunk samples are in the FIFO, 
+        # bounded by min_refresh_delay and max_refresh_delay
+        self.adaptive_delay = adaptive_delay
+        self.target_chunk = 10000
+        self.min_refresh_delay = .1 if packed_fifo else .3
+        self.max_refresh_delay = 1.
+
+        self.fifo_fill = 0.
+        self.chunk_size = 0
+        self.loop_time = 0.
+        self.current_refresh_delay = refresh_delay
+
+        # buffered: FIFO drains do not wait on _save_data, chunks spill to disk if saving lags
+        self.buffered = False
+        self.buffer_length = 16
+        self.overflow_policy = 'spill'
+        self.buffer = None
+
+        # compact_time: store the adwin timestamps as (t0, dt, n) records, applies at the next start
+        self.compact_time = False
+        self.compacting = False
+        self.timebase = TimebaseEncoder()
+        self.compact_dtype = compact_dtype('<f8')
 
         self.open()
         self.lock = Lock()
@@ -62,19 +269,58 @@ class ADwinGold2(BaseDriver):
 
         self.V1_ovl = False
         self.V2_ovl = False
+        # statistics of the last chunk
+        self.stats = chunk_stats([], {'V1': [], 'V2': []})
+
+        # decimated levels adwin_<factor>x, so long measurements stay plottable
+        self.pyramiding = False
+        self.pyramid = Pyramid(['V1', 'V2'], factors=(10, 100, 1000))
+
+        self.calibration = CalibrationCache(f"{self._name}Calibration")
+
+        # dI/dV of sweeps, smoothed over didv_window samples
+        self.differentiating = False
+        self.didv = DifferentialConductance(window=21)
+        # rows written to resistance and dIdV, to keep them aligned
+        self.resistance_rows = 0
+        self.didv_rows = 0
+
+        # index of sweep segments, rows of the adwin dataset
+        self.segmenting = False
+        self.segmenter = SweepSegmenter(cv_time=1.0)
+
+        # I over V of every sweep, binned on np.linspace(bin_start, bin_stop, bin_points)
+        # set the grid to the voltage range of the sample before setBinning(True)
+        self.binning = False
+        self.binner = SweepBinner(start=-1e-3, stop=1e-3, points=201)
+
+        # software lock-in, the excitation at lockin_frequency comes from an external source
+        self.locking = False
+        self.lockin = DigitalLockIn(
+            frequency=17.77, 
+            harmonics=(1,), 
+            time_constant=.1, 
+            order=2, 
+            decimation=1000,
+            )
+
+        # hand structured arrays to dgw.append instead of dicts of lists
+        self.array_mode = True
 
 
     def open(self):
         logger.info('%s.open()', self._name)
         self.inst = ADwin()
         self.inst.Boot(os.path.join(os.path.dirname(__file__), "external/ADwin11.btl"))
-        self.inst.Load_Process(os.path.join(os.path.dirname(__file__), "external/adwingold2_v6.TB0"))
+        process_file = PACKED_PROCESS_FILE if self.packed_fifo else PROCESS_FILE
+        self.inst.Load_Process(os.path.join(os.path.dirname(__file__), process_file))
         self.inst.Start_Process(ProcessNo=10)
         status = self.inst.Process_Status(ProcessNo=10)
         logger.debug("%s.open(), status: %s", self._name, status)
 
     def close(self):
         logger.debug(f'{self._name}.close()')
+        self.calibration.disconnect()
 
     """
     Status measurement
@@ -103,12 +349,46 @@ class ADwinGold2(BaseDriver):
             "V2_ovl": V2_ovl,
         }
 
+    def get_acquisition_status(self):
+        logger.debug('%s.get_acquisition_status()', self._name)
+        return {
+            "time": time.time(),
+            "fifo_fill": self.fifo_fill,
+            "chunk_size": self.chunk_size,
+            "loop_time": self.loop_time,
+            "refresh_delay": self.current_refresh_delay,
+            **{key: self.stats[key] for key in self.stats.dtype.names[2:]},
+            "lockin": self.locking,
+            "lockin_frequency": self.lockin.frequency,
+            **self._buffer_status(),
+        }
+
+    def _buffer_status(self):
+        # same keys before the first buffered measurement, the status dataset has fixed columns
+        if self.buffer is None:
+            return BUFFER_STATUS
+        return self.buffer.stats()
+
     """
     Measurement
     """
     def start_measuring(self):
         logger.info('%s.start_measuring()', self._name)
 
+        # Callbacks need the data server, which is not running at __init__
+        self.calibration.connect()
+        self.didv.reset()
+        self.resistance_rows = 0
+        self.didv_rows = 0
+        self.segmenter.reset()
+        self.binner.reset()
+        self.lockin.reset()
+        self.timebase.reset()
+        self.pyramid.reset()
+        self.compacting = self.compact_time
+        # float32 only if the averaged ADC values fit into it
+        self.compact_dtype = compact_dtype(value_dtype(self.averaging))
+
         # Start the measurement. Clear FIFOs
         self._time_offset = time.time()
         with self.lock:
@@ -116,6 +396,9 @@ class ADwinGold2(BaseDriver):
 
     def get_data(self):
         logger.info('%s.get_data()', self._name)     
+        if self.packed_fifo:
+            return self._get_data_packed()
+
         with self.lock:
             l = [
                 self.inst.Fifo_Full(FifoNo=1),
@@ -126,9 +409,49 @@ class ADwinGold2(BaseDriver):
 
         l = list(map(int, l))
         count = min(l)
+        self._track_fifo(count)
         if count <= 0:
             return None
 
+        if not self.array_mode:
+            return self._get_data_lists(count)
+
+        # ctypes buffers are viewed, not copied, and written straight into the columns
+        data = np.empty(count, dtype=ADWIN_DTYPE)
+        with self.lock:
+            data['V1'] = np.ctypeslib.as_array(self.inst.GetFifo_Double(FifoNo=1, Count=count))
+            data['V2'] = np.ctypeslib.as_array(self.inst.GetFifo_Double(FifoNo=2, Count=count))
+            data['trigger'] = np.ctypeslib.as_array(self.inst.GetFifo_Double(FifoNo=8, Count=count))
+            data['time'] = np.ctypeslib.as_array(self.inst.GetFifo_Double(FifoNo=9, Count=count))
+        data['time'] += self._time_offset
+        return data
+
+    def _get_data_packed(self):
+        logger.info('%s._get_data_packed()', self._name)
+        with self.lock:
+            count = int(self.inst.Fifo_Full(FifoNo=PACKED_FIFO))
+            # only read complete records
+            count -= count % PACKED_WIDTH
+            self._track_fifo(count // PACKED_WIDTH)
+            if count <= 0:
+                return None
+            raw = self.inst.GetFifo_Double(FifoNo=PACKED_FIFO, Count=count)
+
+        # zero-copy view with one record per row, copied once into the dataset dtype
+        records = np.ctypeslib.as_array(raw).reshape(-1, PACKED_WIDTH)
+        data = np.empty(records.shape[0], dtype=ADWIN_DTYPE)
+        data['time'] = records[:, 0]
+        data['V1'] = records[:, 1]
+        data['V2'] = records[:, 2]
+        data['trigger'] = records[:, 3]
+        data['time'] += self._time_offset
+
+        if not self.array_mode:
+            return {key: list(data[key]) for key in ADWIN_DTYPE.names}
+        return data
+
+    def _get_data_lists(self, count):
+        logger.info('%s._get_data_lists()', self._name)
         with self.lock:
             V1 = np.array(self.inst.GetFifo_Double(FifoNo=1, Count=count), dtype='float64')
             V2 = np.array(self.inst.GetFifo_Double(FifoNo=2, Count=count), dtype='float64')
@@ -136,18 +459,38 @@ class ADwinGold2(BaseDriver):
             trigger = np.array(self.inst.GetFifo_Double(FifoNo=8, Count=count), dtype='int')
             times = np.array(self.inst.GetFifo_Double(FifoNo=9, Count=count), dtype='float64') + self._time_offset
 
-        if np.any(V1>=9.5) or np.any(V1<=-9.5):
-            self.V1_ovl = True
-
-        if np.any(V2>=9.5) or np.any(V2<=-9.5):
-            self.V2_ovl = True
-            
         return {
             "time": list(times),
             "V1": list(V1),
             "V2": list(V2),
             "trigger": list(trigger),
         }
+
+    def _track_fifo(self, count):
+        self.chunk_size = count
+        self.fifo_fill = count / FIFO_LENGTH
+        if self.fifo_fill > FIFO_HIGH_WATER:
+            logger.warning('%s FIFO %.0f%% full.', self._name, 100 * self.fifo_fill)
+
+    def _next_refresh_delay(self, delay, loop_time):
+        self.loop_time = loop_time
+        if self.adaptive_delay:
+            if self.fifo_fill > FIFO_HIGH_WATER:
+                # falling behind, drain right away
+                delay = 0.
+            else:
+                # time to collect target_chunk samples, minus the time spent draining
+                delay = self.target_chunk / self.sample_rate - loop_time
+                delay = min(max(delay, self.min_refresh_delay), self.max_refresh_delay)
+        self.current_refresh_delay = delay
+        return delay
+
+    def _check_overload(self, stats):
+        if stats['V1_ovls'] > 0:
+            self.V1_ovl = True
+
+        if stats['V2_ovls'] > 0:
+            self.V2_ovl = True
     
     """
     Saving
@@ -164,14 +507,34 @@ class ADwinGold2(BaseDriver):
         if array is None:
             return
         
+        # Take care of chunk statistics
+        stats = chunk_stats(array['time'], {'V1': array['V1'], 'V2': array['V2']})
+        self.stats = stats
+        self._check_overload(stats)
+        dgw.append(
+            f"{hdf5_path}/{STATS_NAME}", 
+            np.array(stats, ndmin=1), 
+            **kwargs
+            )
+        dgw.append(
+            f"/{STATUS_NAME}/{self._name}_{ACQUISITION_NAME}", 
+            {key: [value] for key, value in self.get_acquisition_status().items()}, 
+            **kwargs
+            )
+
         # Take care of normal saving
         adwin_path = f"{hdf5_path}/{ADWIN_NAME}"
-        adwin_data = {
-            "time": array['time'],
-            "V1": array['V1'],
-            "V2": array['V2'],
-            "trigger": array['trigger'],
-        }
+        if self.compacting:
+            adwin_data = self._compact(hdf5_path, array, dgw, **kwargs)
+        elif isinstance(array, np.ndarray):
+            adwin_data = array
+        else:
+            adwin_data = {
+                "time": array['time'],
+                "V1": array['V1'],
+                "V2": array['V2'],
+                "trigger": array['trigger'],
+            }
         dgw.append(
             adwin_path, 
             adwin_data, 
@@ -179,14 +542,26 @@ class ADwinGold2(BaseDriver):
             **kwargs
             )
 
+        # Take care of the decimated levels
+        if self.pyramiding:
+            self._save_pyramid(hdf5_path, array, dgw, **kwargs)
+
+        # Take care of the sweep segments
+        if self.segmenting:
+            self._save_startstop(hdf5_path, array['time'], array['trigger'], dgw, **kwargs)
+
+        # Take care of lockin saving
+        if self.locking:
+            self._save_lockin(hdf5_path, array, dgw, **kwargs)
+
         # Take care of saving V_off
         if not self.output or self.amplitude==0:
             offset_path = f"{hdf5_path}/{OFFSET_NAME}"
-            self.V1_off = np.mean(array['V1'])
-            self.V2_off = np.mean(array['V2'])
+            self.V1_off = stats['V1_mean']
+            self.V2_off = stats['V2_mean']
 
             offset_data = {
-                "time": np.mean(array['time']),
+                "time": stats['time'],
                 "V1_off": self.V1_off,
                 "V2_off": self.V2_off,
             }
@@ -197,78 +572,218 @@ class ADwinGold2(BaseDriver):
                 max_length=int(1e5), 
                 **kwargs
                 )
+            self.calibration.set_offset(offset_path, self.V1_off, self.V2_off)
             
         # Take care of saving R, V, I
         if self.calculating and self.output:
             resistance_path = f"{hdf5_path}/{RESISTANCE_NAME}"
 
             # Handle offset
-            try:
-                offset_path = f"{hdf5_path}/{OFFSET_NAME}"
-                offset = dgw.get_data(offset_path, indices = slice(-2,-1,1))
-                if offset.shape == (0,):
-                    # covert edge case when calc and output running and measurement wird dann eingeschalten
-                    V1_off = 0
-                    V2_off = 0
-                else:
-                    V1_off = offset['V1_off']
-                    V2_off = offset['V2_off']
-            except KeyError:
-                logger.warning("%s._save_data() no V_off found!")
+            offset_path = f"{hdf5_path}/{OFFSET_NAME}"
+            offset = self.calibration.get_offset(offset_path, dgw)
+            if offset is None:
+                logger.warning("%s._save_data() no V_off found!", self._name)
                 V1_off = 0
                 V2_off = 0
+            else:
+                V1_off, V2_off = offset
 
             # Handle amplification
-            try:
-                femto_path = f"{STATUS_NAME}/{FEMTO_NAME}"
-                # femto_path = f"{hdf5_path}/{FEMTO_NAME}"
-                femto = dgw.get_data(femto_path, indices = slice(-2, -1, 1))
-                amp_V1 = femto['amp_A']
-                amp_V2 = femto['amp_B']
-            except KeyError:
-                logger.warning("%s._save_data() no amp_V found!")
+            femto = self.calibration.get(FEMTO_PATH, dgw)
+            if femto is None:
+                logger.warning("%s._save_data() no amp_V found!", self._name)
                 amp_V1 = 1
                 amp_V2 = 1
+            else:
+                amp_V1 = femto['amp_A']
+                amp_V2 = femto['amp_B']
 
             # Handle R_ref
-            try:
-                rref_path = f"{STATUS_NAME}/{RREF_NAME}"
-                # rref_path = f"{hdf5_path}/{RREF_NAME}"
-                rref = dgw.get_data(rref_path, indices = slice(-2, -1, 1))
-                R_ref = rref['R_ref']
-            except KeyError:
-                logger.warning("%s._save_data() no R_ref found!")
+            rref = self.calibration.get(RREF_PATH, dgw)
+            if rref is None:
+                logger.warning("%s._save_data() no R_ref found!", self._name)
                 R_ref = 1
+            else:
+                R_ref = rref['R_ref']
 
             # Handle Calculations
             t = array["time"]
-            V = (np.array(array['V1'], dtype='float64') - V1_off) / amp_V1
-            I = (np.array(array['V2'], dtype='float64') - V2_off) / amp_V2 / R_ref
+            V = (np.asarray(array['V1'], dtype='float64') - V1_off) / amp_V1
+            I = (np.asarray(array['V2'], dtype='float64') - V2_off) / amp_V2 / R_ref
 
-            R = np.zeros(len(V))
+            R = np.full(len(V), np.nan)
             logic = np.abs(I) > self.current_threshold
-            R[logic] = V[logic] / I[logic]
-            R[np.abs(I) <= self.current_threshold] = np.nan     
-            R = R - self.series_resistance
-
-            G_0 = 7.748e-5 # Siemens oder 1/Ohm
-            G = 1 / R / G_0 
-            # dIdV = np.gradient(I,V) / G_0 
-
-            resistance_data = {
-                "time": list(t),
-                "G (G_0)": list(G),
-                # "dI/dV (G_0)": list(dIdV),
-                "R (Ohm)": list(R),
-                "V (V)": list(V),
-                "I (A)": list(I),
-            }
+            np.divide(V, I, out=R, where=logic)
+            R -= self.series_resistance
+
+            G = np.full(len(R), np.nan)
+            np.divide(1, R, out=G, where=R != 0)
+            G /= G_0
+
+            if isinstance(array, np.ndarray):
+                resistance_data = np.empty(len(V), dtype=RESISTANCE_DTYPE)
+                resistance_data["time"] = t
+                resistance_data["G (G_0)"] = G
+                resistance_data["R (Ohm)"] = R
+                resistance_data["V (V)"] = V
+                resistance_data["I (A)"] = I
+            else:
+                resistance_data = {
+                    "time": list(t),
+                    "G (G_0)": list(G),
+                    "R (Ohm)": list(R),
+                    "V (V)": list(V),
+                    "I (A)": list(I),
+                }
             dgw.append(
                 resistance_path, 
                 resistance_data, 
                 max_length=int(1e5), 
                 **kwargs
                 )
+            row = self.resistance_rows
+            self.resistance_rows += len(V)
+
+            # Take care of saving dI/dV
+            if self.differentiating:
+                self._save_didv(hdf5_path, row, t, V, I, array['trigger'], dgw, **kwargs)
+
+            # Take care of saving binned sweeps
+            if self.binning:
+                self._save_sweeps(hdf5_path, t, V, I, array['trigger'], dgw, **kwargs)
+
+    def _compact(self, hdf5_path, array, dgw, **kwargs):
+        """adwin rows without time, the timestamps are appended to timebase."""
+        timebase_data = self.timebase.process(
+            array['time'], 
+            self.averaging / self.processor_rate,
+            )
+        dgw.append(
+            f"{hdf5_path}/{TIMEBASE_NAME}", 
+            timebase_data, 
+            **kwargs
+            )
+
+        adwin_data = np.empty(len(array['time']), dtype=self.compact_dtype)
+        adwin_data['V1'] = array['V1']
+        adwin_data['V2'] = array['V2']
+        adwin_data['trigger'] = array['trigger']
+        return adwin_data
+
+    def _save_pyramid(self, hdf5_path, array, dgw, **kwargs):
+        levels = self.pyramid.process(
+            array['time'], 
+            {'V1': array['V1'], 'V2': array['V2']},
+            )
+        for factor, level_data in zip(self.pyramid.factors, levels):
+            if len(level_data) == 0:
+                continue
+            dgw.append(
+                f"{hdf5_path}/{ADWIN_NAME}_{factor}x", 
+                level_data, 
+                plot_config="pyramid",
+                pyramid_base=ADWIN_NAME,
+                factor=factor,
+                **kwargs
+                )
+
+    def _save_startstop(self, hdf5_path, t, trigger, dgw, **kwargs):
+        startstop_data = self.segmenter.process(t, trigger)
+        if len(startstop_data) == 0:
+            return
+        dgw.append(
+            f"{hdf5_path}/{STARTSTOP_NAME}", 
+            startstop_data, 
+            **kwargs
+            )
+
+    def _save_sweeps(self, hdf5_path, t, V, I, trigger, dgw, **kwargs):
+        sweeps = self.binner.process(
+            np.asarray(t), 
+            V, 
+            I, 
+            np.asarray(trigger),
+            )
+        # same datasets and attributes as calculator2.calc_sweep
+        for name, direction in [(SWEEPS_UP_NAME, 1), (SWEEPS_DOWN_NAME, 0)]:
+            sweeps_data = sweeps[sweeps['case'] % 2 == direction]
+            if len(sweeps_data) == 0:
+                continue
+            dgw.append(
+                f"{hdf5_path}/{name}", 
+                sweeps_data, 
+                x_axis = 'V [V]',
+                start = self.binner.start,
+                stop = self.binner.stop,
+                points = self.binner.points,
+                plot_config = "lnspc",
+                **kwargs
+                )
+
+    def _save_lockin(self, hdf5_path, array, dgw, **kwargs):
+        t, xy = self.lockin.process(
+            array['time'], 
+            np.stack((array['V1'], array['V2']), axis=1), 
+            self.sample_rate,
+            )
+        if len(t) == 0:
+            return
+
+        names = self.lockin.names([1, 2])
+        lockin_data = np.empty(
+            len(t), 
+            dtype=[('time', '<f8')] + [(name, '<f8') for name in names] + [('dI/dV (G_0)', '<f8')],
+            )
+        lockin_data['time'] = t
+        for i, name in enumerate(names):
+            lockin_data[name] = xy[:, i]
+
+        # in-phase part of I/V at the first harmonic
+        lockin_data['dI/dV (G_0)'] = np.nan
+        if 1 in self.lockin.harmonics:
+            femto = self.calibration.get(FEMTO_PATH, dgw)
+            rref = self.calibration.get(RREF_PATH, dgw)
+            amp_V1 = 1 if femto is None else femto['amp_A']
+            amp_V2 = 1 if femto is None else femto['amp_B']
+            R_ref = 1 if rref is None else rref['R_ref']
+            V = (lockin_data['X1'] + 1j * lockin_data['Y1']) / amp_V1
+            I = (lockin_data['X2'] + 1j * lockin_data['Y2']) / amp_V2 / R_ref
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lockin_data['dI/dV (G_0)'] = np.real(I / V) / G_0
+
+        dgw.append(
+            f"{hdf5_path}/{LOCKIN_NAME}", 
+            lockin_data, 
+            max_length=int(1e5), 
+            **kwargs
+            )
+
+    def _save_didv(self, hdf5_path, row, t, V, I, trigger, dgw, **kwargs):
+        """dI/dV of the resistance rows from ``row`` on."""
+        if self.didv.row != row:
+            # chunks were saved without dI/dV, the carried over samples do not fit anymore
+            self.didv.reset(row)
+        rows, _, _, _, dIdV = self.didv.process(
+            np.asarray(t), 
+            V, 
+            I, 
+            np.asarray(trigger),
+            )
+        if len(rows) == 0:
+            return
+
+        # time, V and I are in resistance, fill up to the last evaluated row
+        stop = rows[-1] + 1
+        didv_data = np.empty(stop - self.didv_rows, dtype=DIDV_DTYPE)
+        didv_data["dI/dV (G_0)"] = np.nan
+        didv_data["dI/dV (G_0)"][rows - self.didv_rows] = dIdV / G_0
+        self.didv_rows = stop
+        dgw.append(
+            f"{hdf5_path}/{DIDV_NAME}", 
+            didv_data, 
+            max_length=int(1e5), 
+            **kwargs
+            )
 
 
     """
@@ -288,6 +803,20 @@ class ADwinGold2(BaseDriver):
     - lockin_amplitude
     - lockin_frequency
     - current threshold
+    - array mode
+    - adaptive delay
+    - target chunk
+    - differentiating
+    - dIdV window
+    - segmenting
+    - cv time
+    - binning
+    - bin start / stop / points
+    - lockin frequency / harmonics / time constant / order / decimation
+    - buffered
+    - overflow policy
+    - compact time
+    - pyramiding
     """
 
     def start_output(self):
@@ -396,4 +925,187 @@ class ADwinGold2(BaseDriver):
     def getSeriesResistance(self):
         logger.info('%s.getSeriesResistance()', self._name)
         return self.series_resistance
+
+    def setDifferentiating(self, value:bool):
+        logger.info('%s.setDifferentiating(%i)', self._name, value)
+        self.differentiating = value
+
+    def getDifferentiating(self):
+        logger.info('%s.getDifferentiating()', self._name)
+        return self.differentiating
+
+    def setDIdVWindow(self, value:int):
+        logger.info('%s.setDIdVWindow(%i)', self._name, value)
+        self.didv.set_window(value)
+
+    def getDIdVWindow(self):
+        logger.info('%s.getDIdVWindow()', self._name)
+        return self.didv.window
+
+    def setSegmenting(self, value:bool):
+        logger.info('%s.setSegmenting(%s)', self._name, value)
+        self.segmenting = value
+
+    def getSegmenting(self):
+        logger.info('%s.getSegmenting()', self._name)
+        return self.segmenting
+
+    def setCVTime(self, value:float):
+        logger.info('%s.setCVTime(%f)', self._name, value)
+        self.segmenter.cv_time = value
+
+    def getCVTime(self):
+        logger.info('%s.getCVTime()', self._name)
+        return self.segmenter.cv_time
+
+    # the sweeps datasets keep the grid of their first sweep, change it between measurements
+    def setBinning(self, value:bool):
+        logger.info('%s.setBinning(%s)', self._name, value)
+        self.binning = value
+
+    def getBinning(self):
+        logger.info('%s.getBinning()', self._name)
+        return self.binning
+
+    def setBinStart(self, value:float):
+        logger.info('%s.setBinStart(%f)', self._name, value)
+        self.binner.set_grid(value, self.binner.stop, self.binner.points)
+
+    def getBinStart(self):
+        logger.info('%s.getBinStart()', self._name)
+        return self.binner.start
+
+    def setBinStop(self, value:float):
+        logger.info('%s.setBinStop(%f)', self._name, value)
+        self.binner.set_grid(self.binner.start, value, self.binner.points)
+
+    def getBinStop(self):
+        logger.info('%s.getBinStop()', self._name)
+        return self.binner.stop
+
+    def setBinPoints(self, value:int):
+        logger.info('%s.setBinPoints(%i)', self._name, value)
+        self.binner.set_grid(self.binner.start, self.binner.stop, value)
+
+    def getBinPoints(self):
+        logger.info('%s.getBinPoints()', self._name)
+        return self.binner.points
+
+    def start_lockin(self):
+        self.setLocking(True)
+
+    def stop_lockin(self):
+        self.setLocking(False)
+
+    def setLocking(self, value:bool):
+        logger.info('%s.setLocking(%s)', self._name, value)
+        if value and not self.locking:
+            self.lockin.reset()
+        self.locking = value
+
+    def getLocking(self):
+        logger.info('%s.getLocking()', self._name)
+        return self.locking
+
+    def setLockinFrequency(self, value:float):
+        logger.info('%s.setLockinFrequency(%f)', self._name, value)
+        self.lockin.frequency = value
+
+    def getLockinFrequency(self):
+        logger.info('%s.getLockinFrequency()', self._name)
+        return self.lockin.frequency
+
+    # the lockin dataset keeps the columns of its first row, change harmonics between measurements
+    def setLockinHarmonics(self, value:list):
+        logger.info('%s.setLockinHarmonics(%s)', self._name, value)
+        self.lockin.harmonics = tuple(int(h) for h in value)
+        self.lockin.reset()
+
+    def getLockinHarmonics(self):
+        logger.info('%s.getLockinHarmonics()', self._name)
+        return list(self.lockin.harmonics)
+
+    def setLockinTimeConstant(self, value:float):
+        logger.info('%s.setLockinTimeConstant(%f)', self._name, value)
+        self.lockin.time_constant = value
+
+    def getLockinTimeConstant(self):
+        logger.info('%s.getLockinTimeConstant()', self._name)
+        return self.lockin.time_constant
+
+    def setLockinOrder(self, value:int):
+        logger.info('%s.setLockinOrder(%i)', self._name, value)
+        self.lockin.order = max(int(value), 1)
+        self.lockin.state = None
+
+    def getLockinOrder(self):
+        logger.info('%s.getLockinOrder()', self._name)
+        return self.lockin.order
+
+    def setLockinDecimation(self, value:int):
+        logger.info('%s.setLockinDecimation(%i)', self._name, value)
+        self.lockin.decimation = max(int(value), 1)
+
+    def getLockinDecimation(self):
+        logger.info('%s.getLockinDecimation()', self._name)
+        return self.lockin.decimation
+
+    def setAdaptiveDelay(self, value:bool):
+        logger.info('%s.setAdaptiveDelay(%i)', self._name, value)
+        self.adaptive_delay = value
+
+    def getAdaptiveDelay(self):
+        logger.info('%s.getAdaptiveDelay()', self._name)
+        return self.adaptive_delay
+
+    def setTargetChunk(self, value:int):
+        logger.info('%s.setTargetChunk(%i)', self._name, value)
+        self.target_chunk = int(value)
+
+    def getTargetChunk(self):
+        logger.info('%s.getTargetChunk()', self._name)
+        return self.target_chunk
+
+    # buffered and overflow_policy apply to the next measurement
+    def setBuffered(self, value:bool):
+        logger.info('%s.setBuffered(%s)', self._name, value)
+        self.buffered = value
+
+    def getBuffered(self):
+        logger.info('%s.getBuffered()', self._name)
+        return self.buffered
+
+    def setOverflowPolicy(self, value:str):
+        logger.info('%s.setOverflowPolicy(%s)', self._name, value)
+        if value not in ChunkBuffer.POLICIES:
+            raise ValueError(f'overflow policy must be one of {ChunkBuffer.POLICIES}')
+        self.overflow_policy = value
+
+    def getOverflowPolicy(self):
+        logger.info('%s.getOverflowPolicy()', self._name)
+        return self.overflow_policy
+
+    def setCompactTime(self, value:bool):
+        logger.info('%s.setCompactTime(%s)', self._name, value)
+        self.compact_time = value
+
+    def getCompactTime(self):
+        logger.info('%s.getCompactTime()', self._name)
+        return self.compact_time
+
+    def setPyramiding(self, value:bool):
+        logger.info('%s.setPyramiding(%s)', self._name, value)
+        self.pyramiding = value
+
+    def getPyramiding(self):
+        logger.info('%s.getPyramiding()', self._name)
+        return self.pyramiding
+
+    def setArrayMode(self, value:bool):
+        logger.info('%s.setArrayMode(%i)', self._name, value)
+        self.array_mode = value
+
+    def getArrayMode(self):
+        logger.info('%s.getArrayMode()', self._name)
+        return self.array_mode
     
\ No newline at end of file
@@ -17,6 +17,13 @@ import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# states of STATE?, see AMI430.get_state
+STATE_RAMPING = 1
+STATE_HOLDING = 2
+STATE_PAUSED = 3
+STATE_QUENCH = 7
+STATE_ZERO = 8
+
 class AMI430(ThreadSafeBaseDriver):
     """Driver for the AM430 or AMI430, specifically used in BlueFors @ P10. Since it is MessageBased, we can use much
     of the ThreadSafeBaseDriver class.
@@ -226,6 +233,19 @@ class AMI430(ThreadSafeBaseDriver):
         logger.info('%s.get_rate()', self._name)
         return float(self._rate)
 
+    def get_ramp_rate(self):
+        """Rate in T/min of the segment the field is in, as configured in the instrument. After
+        set_rate(0) the default segments are used, while get_rate returns 0."""
+        logger.info('%s.get_ramp_rate()', self._name)
+        field = abs(self.get_field())
+        segments = int(self.query('RAMP:RATE:SEGments?'))
+        rate = 0.
+        for segment in range(1, segments + 1):
+            rate, upper = (float(x) for x in self.query(f'RAMP:RATE:FIELD:{segment}?').split(','))
+            if field <= upper:
+                break
+        return rate
+
     def set_target_field(self, target: float):
         logger.info('%s.set_target_field(%f)', self._name, target)
         self._target = target
@@ -246,4 +266,40 @@ class AMI430(ThreadSafeBaseDriver):
     def get_target_field(self):
         logger.info('%s.get_target_field()', self._name)
         target = self._target
-        return float(target)
\ No newline at end of file
+        return float(target)
+
+
+def wait_until_holding(
+        magnet,
+        timeout: float = 3600.,
+        poll: float = 1.,
+        max_poll: float = 30.,
+    ):
+    """Block until ``magnet`` (an AMI430 or its gateway) holds the target field.
+
+    The state is polled every ``poll`` seconds, while far from the target less often: every half
+    of the remaining ramp time estimated from field, target and rate, at most every ``max_poll``
+    seconds. Returns (holding, waited time in s), False after a pause, a quench or the timeout.
+    """
+    tic = time.time()
+    while True:
+        state = int(magnet.get_state())
+        waited = time.time() - tic
+        if state in (STATE_HOLDING, STATE_ZERO):
+            logger.info('magnet holding after %.1fs', waited)
+            return True, waited
+        if state in (STATE_PAUSED, STATE_QUENCH):
+            logger.error('magnet stopped in state %i after %.1fs', state, waited)
+            return False, waited
+        if waited >= timeout:
+            logger.warning('magnet not holding after %.1fs (state %i)', waited, state)
+            return False, waited
+
+        delay = poll
+        # not get_rate, which is 0 while the default segments are used
+        rate = float(magnet.get_ramp_rate()) # T/min
+        if rate > 0:
+            remaining = abs(float(magnet.get_target_field()) - float(magnet.get_field())) / rate * 60
+            if np.isfinite(remaining):
+                delay = min(max(remaining / 2, poll), max_poll)
+        time.sleep(min(delay, max(timeout - waited, 0)))
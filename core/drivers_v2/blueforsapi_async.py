@@ -0,0 +1,188 @@
+"""
+asyncio client for the BlueFors control software API, a drop-in for BlueForsWorker.
+
+Sample polling, status polling and settings writes run as tasks on one event loop in the client
+thread, so a slow POST does not hold up the polling. The driver reads the latest values with
+``snapshot()``, hands in settings with ``write()`` and gets the sample temperature from
+``queue``, like with BlueForsWorker. Samples missed during an outage are not recovered.
+"""
+import json
+import asyncio
+from threading import Lock
+from time import time, perf_counter
+from logging import getLogger
+
+import aiohttp
+
+from core.drivers_v2.blueforsapi_v2 import BlueForsWorker
+
+logger = getLogger(__name__)
+
+ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError)
+
+class AsyncBlueForsClient(BlueForsWorker):
+    """BlueForsWorker on an event loop, see the module docstring."""
+    def __init__(self, *args, timeout=3., **kwargs):
+        super().__init__(*args, **kwargs)
+        self.daemon = True
+        # requests go through aiohttp
+        self.session.close()
+        self.session = None
+
+        self.timeout = timeout
+        self.loop = None
+        self._data_lock = Lock()
+        self._wake_writer = None
+        self._wake_status = None
+
+    """
+    thread safe access
+    """
+    def snapshot(self):
+        """copy of the latest values, {"data": {key: ...}}"""
+        with self._data_lock:
+            return {"data": dict(self.data['data'])}
+
+    def write(self, values: dict):
+        super().write(values)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake_writer.set)
+
+    """
+    event loop
+    """
+    def run(self):
+        logger.info('%s is running.', self._name)
+        asyncio.run(self._main())
+        logger.info('%s stopped.', self._name)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._wake_writer = asyncio.Event()
+        self._wake_status = asyncio.Event()
+        if self.pending:
+            self._wake_writer.set()
+
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as self.session:
+            tasks = [
+                asyncio.create_task(self._sample_loop()),
+                asyncio.create_task(self._status_loop()),
+                asyncio.create_task(self._write_loop()),
+            ]
+            await self.loop.run_in_executor(None, self.exit_request.wait)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop = None
+
+    async def _fetch(self, method, url, **kwargs):
+        tic = perf_counter()
+        async with self.session.request(method, url, **kwargs) as resp:
+            body = await resp.read()
+            status = resp.status
+        self._account(len(body), tic)
+        return status, body
+
+    async def _request(self, method, url, **kwargs):
+        status, body = await self._fetch(method, url, **kwargs)
+        if status >= 400:
+            raise ValueError(f'{method} {url} returned {status}')
+        return json.loads(body)
+
+    async def _subtree(self, prefix):
+        status, body = await self._fetch('GET', f"{self.url}{prefix.replace('.', '/')}")
+        # not found means no subtree requests, other errors are outages
+        if status == 404:
+            return {}
+        if status >= 400:
+            raise ValueError(f'GET {prefix} returned {status}')
+        return json.loads(body)
+
+    async def _get(self, keys):
+        """values of all keys below the given prefixes, requested at the same time"""
+        if self.filtered:
+            bodies = await asyncio.gather(*[self._subtree(prefix) for prefix in keys])
+            values = {}
+            for prefix, body in zip(keys, bodies):
+                data = body.get('data', None)
+                if data is None or not all(k.startswith(prefix) for k in data):
+                    logger.info('%s subtree requests not supported, polling %s', self._name, self.url)
+                    self.filtered = False
+                    break
+                values.update(data)
+            else:
+                return values
+
+        data = (await self._request('GET', self.url))['data']
+        return {k: v for k, v in data.items() if any(k.startswith(prefix) for prefix in keys)}
+
+    def _merge(self, values):
+        with self._data_lock:
+            merged = dict(self.data['data'])
+            merged.update(values)
+            self.data = {"data": merged}
+
+    async def _sample_loop(self):
+        while True:
+            try:
+                values = await self._get(self.sample_prefixes)
+                self._merge(values)
+                self._sample(values)
+            except ERRORS as e:
+                self.errors += 1
+                logger.warning('%s poll failed: %s', self._name, e)
+            await asyncio.sleep(self.delay)
+
+    async def _status_loop(self):
+        while True:
+            try:
+                values = await self._get(self.status_prefixes)
+                self._merge(values)
+                if self.unconfirmed:
+                    self._confirm(values)
+            except ERRORS as e:
+                self.errors += 1
+                logger.warning('%s status poll failed: %s', self._name, e)
+            # read back early after a write
+            try:
+                await asyncio.wait_for(self._wake_status.wait(), self.status_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_status.clear()
+
+    async def _write_loop(self):
+        while True:
+            await self._wake_writer.wait()
+            self._wake_writer.clear()
+            with self.write_lock:
+                values = dict(self.pending)
+            if not values:
+                continue
+
+            post = {"data": {key: {"content": {"value": value}} for key, value in values.items()}}
+            post["data"]["driver.lakeshore.write"] = {"content": {"call": 1}}
+            try:
+                await self._request('POST', self.url, json=post)
+            except ERRORS as e:
+                self.errors += 1
+                logger.warning('%s post failed: %s', self._name, e)
+                await asyncio.sleep(self.delay)
+                self._wake_writer.set()
+                continue
+
+            now = time()
+            with self.write_lock:
+                for key, value in values.items():
+                    if self.pending.get(key) == value:
+                        self.pending.pop(key)
+                    self.unconfirmed[key] = (value, now)
+            self.writes += 1
+            self._wake_status.set()
+            logger.info('%s posted %s', self._name, list(values))
+
+    def _confirm(self, values):
+        super()._confirm(values)
+        # settings which were not confirmed went back to pending
+        if self.pending:
+            self._wake_writer.set()
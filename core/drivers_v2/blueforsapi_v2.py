@@ -1,9 +1,9 @@
 # Import needed libraries
 import requests
 import numpy as np
-from time import time
+from time import time, perf_counter
 from logging import getLogger
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from queue import Queue
 from time import sleep
 
@@ -20,16 +20,45 @@ P_STRING = '/pressure'
 H_STRING = '/heater'
 VC_STRING = P_STRING
 D_STRING = '/driver'
+POLL_STRING = '/poll'
+
+# the key polled fast for the measurement
+SAMPLE_KEY = 'driver.lakeshore.status.inputs.channelA.temperature'
+# keys below the same node, e.g. driver.maxigauge.pressures, are requested together
+PREFIX_DEPTH = 3
+
+def prefixes(keys, depth=PREFIX_DEPTH):
+    """one prefix per node of the first ``depth`` components, the longest one common to its keys"""
+    groups = {}
+    for key in keys:
+        parts = key.split('.')
+        node = tuple(parts[:depth])
+        common = groups.setdefault(node, parts)
+        n = 0
+        while n < min(len(common), len(parts)) and common[n] == parts[n]:
+            n += 1
+        groups[node] = common[:n]
+    return ['.'.join(parts) for parts in groups.values()]
 
 # Logger
 logger = getLogger(__name__)
 
 class BlueForsWorker(Thread):
+    """Polls the sample temperature every ``delay`` and the status keys every ``status_delay``.
+
+    Requests go through one keep-alive session and ask only for the subtrees of the keys,
+    /values/driver/maxigauge/pressures instead of /values/. If the API answers a subtree
+    request with something else, the worker falls back to the full endpoint and picks the keys
+    from it. Latency and payload of the polls are kept for the status.
+    """
     def __init__(
         self,
         name,
         url,
+        keys=(),
         delay=1/13.7,
+        status_delay=1.,
+        confirm_timeout=5.,
     ):
         logger.info('%s.__init__()', name)
         super().__init__()
@@ -37,47 +66,183 @@ class BlueForsWorker(Thread):
         self._name = name
         self.url = url
         self.delay = delay
+        self.status_delay = status_delay
         self.data = {"data": {}}
 
+        self.sample_prefixes = [SAMPLE_KEY]
+        self.status_prefixes = prefixes(keys)
+        self.filtered = True
+
+        # settings to post, posted and waiting for the read back, last value handed in
+        self.confirm_timeout = confirm_timeout
+        self.pending = {}
+        self.unconfirmed = {}
+        self.requested = {}
+        self.write_lock = Lock()
+        self.writes = 0
+        self.retries = 0
+
+        self.session = requests.Session()
+        self.latency = 0
+        self.latency_max = 0
+        self.payload = 0
+        self.received = 0
+        self.polls = 0
+        self.errors = 0
+
         self.exit_request = Event()
         self.queue = Queue()
 
         self._latest_t_measurement = 0
+        self._latest_status_poll = 0
+
+    def _account(self, nbytes, tic):
+        latency = perf_counter() - tic
+        self.latency = latency
+        self.latency_max = max(self.latency_max, latency)
+        self.payload = nbytes
+        self.received += self.payload
+        self.polls += 1
+
+    def _get(self, keys):
+        """values of all keys below the given prefixes"""
+        if self.filtered:
+            values = {}
+            for prefix in keys:
+                tic = perf_counter()
+                req = self.session.get(f"{self.url}{prefix.replace('.', '/')}", timeout=3)
+                self._account(len(req.content), tic)
+                # not found means no subtree requests, other errors are outages
+                if req.status_code != 404:
+                    req.raise_for_status()
+                data = req.json().get('data', None) if req.ok else None
+                if data is None or not all(k.startswith(prefix) for k in data):
+                    logger.info('%s subtree requests not supported, polling %s', self._name, self.url)
+                    self.filtered = False
+                    break
+                values.update(data)
+            else:
+                return values
+
+        tic = perf_counter()
+        req = self.session.get(self.url, timeout=3)
+        self._account(len(req.content), tic)
+        req.raise_for_status()
+        data = req.json()['data']
+        return {k: v for k, v in data.items() if any(k.startswith(prefix) for prefix in keys)}
+
+    def poll(self):
+        now = time()
+        keys = list(self.sample_prefixes)
+        if now - self._latest_status_poll >= self.status_delay:
+            keys += self.status_prefixes
+            self._latest_status_poll = now
+        values = dict(self.data['data'])
+        values.update(self._get(keys))
+        self.data = {"data": values}
+        if self.unconfirmed:
+            self._confirm(values)
+
+        self._sample(values)
+
+    def _sample(self, values):
+        """queue the sample temperature if it is new"""
+        if SAMPLE_KEY in values.keys():
+            data = values[SAMPLE_KEY]['content']['latest_value']
+            date, value = float(data['date'])/1000.0, data['value']
+            if date!=self._latest_t_measurement and value!='outdated':
+                self._latest_t_measurement = date
+                try:
+                    value = float(value)
+                except ValueError:
+                    value = np.nan
+                self.queue.put(np.array([date, value]))
+
+    def snapshot(self):
+        """the latest values, {"data": {key: ...}}"""
+        return self.data
+
+    def write(self, values: dict):
+        """Post the settings with the next poll."""
+        with self.write_lock:
+            self.pending.update(values)
+            self.requested.update(values)
+
+    def _post(self):
+        with self.write_lock:
+            values = dict(self.pending)
+        if not values:
+            return
+        post = {"data": {key: {"content": {"value": value}} for key, value in values.items()}}
+        post["data"]["driver.lakeshore.write"] = {"content": {"call": 1}}
+        self.session.post(self.url, json=post, timeout=1).raise_for_status()
+
+        now = time()
+        with self.write_lock:
+            for key, value in values.items():
+                # a newer value may have been handed in meanwhile
+                if self.pending.get(key) == value:
+                    self.pending.pop(key)
+                self.unconfirmed[key] = (value, now)
+        self.writes += 1
+        # read back with this poll
+        self._latest_status_poll = 0
+        logger.info('%s posted %s', self._name, list(values))
+
+    def _confirm(self, values):
+        """Compare the posted settings with the values read back, post again after
+        ``confirm_timeout``."""
+        now = time()
+        with self.write_lock:
+            for key, (value, posted) in list(self.unconfirmed.items()):
+                latest = values.get(key, {}).get('content', {}).get('latest_value', {})
+                try:
+                    read = float(latest.get('value'))
+                except (TypeError, ValueError):
+                    read = np.nan
+                # relative only, heater powers are about 1e-9 W
+                if np.isclose(read, float(value), atol=0):
+                    self.unconfirmed.pop(key)
+                elif now - posted > self.confirm_timeout:
+                    logger.warning('%s %s = %s not confirmed (read %s), posting again.', self._name, key, value, read)
+                    self.unconfirmed.pop(key)
+                    self.pending.setdefault(key, value)
+                    self.retries += 1
+
+    def stats(self):
+        return {
+            "latency": self.latency,
+            "latency_max": self.latency_max,
+            "payload": self.payload,
+            "received": self.received,
+            "polls": self.polls,
+            "errors": self.errors,
+            "filtered": self.filtered,
+            "writes": self.writes,
+            "unconfirmed": len(self.unconfirmed) + len(self.pending),
+            "retries": self.retries,
+        }
 
     def run(self):
         logger.info('%s is running.', self._name)
         while not self.exit_request.is_set():
-            req = requests.get(
-                    self.url,
-                    timeout=3,
-                )
-            self.data = req.json()
-
-            if 'driver.lakeshore.status.inputs.channelA.temperature' in self.data['data'].keys():
-                data = self.data['data']['driver.lakeshore.status.inputs.channelA.temperature']['content']['latest_value']
-                date, value = float(data['date'])/1000.0, data['value']
-                if date!=self._latest_t_measurement and value!='outdated':
-                    self._latest_t_measurement = date
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        value = np.nan
-                    self.queue.put(np.array([date, value]))
+            try:
+                self._post()
+                self.poll()
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self.errors += 1
+                logger.warning('%s poll failed: %s', self._name, e)
             sleep(self.delay)
+        self.session.close()
         logger.info('%s stopped.', self._name)
+
 class BlueForsAPI(BaseDriver):
-    def __init__(self, name, address='localhost:49099'):
+    def __init__(self, name, address='localhost:49099', asynchronous=False):
         logger.info('%s.__init__()', name)
         self._name = name
         self._address = address
 
         self.url = f"http://{self._address}/values/"
-        
-        self.blueforsworker = BlueForsWorker(
-            name=f"{self._name}Worker", 
-            url= self.url,
-            )
-        self.blueforsworker.start()
  
         # Sample Heater Default Settings
         self.sample_heater_pid_mode = False
@@ -138,6 +303,19 @@ class BlueForsAPI(BaseDriver):
             ['ramping_rate',    'driver.lakeshore.settings.outputs.sample.ramping_rate',     0, H_STRING],
         ]
 
+        # the asyncio client needs aiohttp
+        worker = BlueForsWorker
+        if asynchronous:
+            from core.drivers_v2.blueforsapi_async import AsyncBlueForsClient as worker
+        self.blueforsworker = worker(
+            name=f"{self._name}Worker", 
+            url= self.url,
+            keys=[d[1] for d in self.status_keys],
+            )
+        self.blueforsworker.start()
+        # all settings once, then only what the setters change
+        self._update_heater()
+
 
     def close(self):
         logger.info('%s.close()', self._name)
@@ -172,9 +350,8 @@ class BlueForsAPI(BaseDriver):
     """
     Status measurement
     """
-    def get_status(self):
-        logger.info('%s.get_status()', self._name)
-        
+    def _heater_settings(self):
+        """the lakeshore sample heater settings as posted to the API"""
         pid_mode = self.sample_heater_pid_mode
         manual_mode = self.sample_heater_manual_mode
         xor_mode = pid_mode ^ manual_mode
@@ -189,32 +366,39 @@ class BlueForsAPI(BaseDriver):
         else:
             self.sample_heater_mode = 0
 
-        # post settings
-        post = {
-            "data": {
-                "driver.lakeshore.settings.outputs.sample.mode": {"content": {"value": self.sample_heater_mode}},
-                "driver.lakeshore.settings.outputs.sample.input": {"content": {"value": self.sample_heater_input}},
-                "driver.lakeshore.settings.outputs.sample.enabled_at_start": {"content": {"value": self.sample_heater_enable_at_start}},
-                "driver.lakeshore.settings.outputs.sample.filtering": {"content": {"value": self.sample_heater_filtering}},
-                "driver.lakeshore.settings.outputs.sample.autoscan_delay": {"content": {"value": self.sample_heater_autoscan_delay}},
-                "driver.lakeshore.settings.outputs.sample.polarity": {"content": {"value": self.sample_heater_polarity}},
-                "driver.lakeshore.settings.outputs.sample.range": {"content": {"value": ranges}},
-                "driver.lakeshore.settings.outputs.sample.resistance": {"content": {"value": self.sample_heater_resistance}},
-                "driver.lakeshore.settings.outputs.sample.display_units": {"content": {"value": self.sample_heater_display_units}},
-                "driver.lakeshore.settings.outputs.sample.manual_value": {"content": {"value": manual_value}},
-                "driver.lakeshore.settings.outputs.sample.p": {"content": {"value": float(self.sample_heater_p)}},
-                "driver.lakeshore.settings.outputs.sample.i": {"content": {"value": float(self.sample_heater_i)}},
-                "driver.lakeshore.settings.outputs.sample.d": {"content": {"value": float(self.sample_heater_d)}},
-                "driver.lakeshore.settings.outputs.sample.setpoint": {"content": {"value": self.sample_heater_setpoint}},
-                "driver.lakeshore.settings.outputs.sample.enable_ramping": {"content": {"value": self.sample_heater_enable_ramping}},
-                "driver.lakeshore.settings.outputs.sample.ramping_rate": {"content": {"value": self.sample_heater_ramping_rate}},
-                "driver.lakeshore.write": {"content": {"call": 1}},
-                }
-            }
-        _ = requests.post(self.url, json=post, timeout=1)
+        return {
+            "driver.lakeshore.settings.outputs.sample.mode": self.sample_heater_mode,
+            "driver.lakeshore.settings.outputs.sample.input": self.sample_heater_input,
+            "driver.lakeshore.settings.outputs.sample.enabled_at_start": self.sample_heater_enable_at_start,
+            "driver.lakeshore.settings.outputs.sample.filtering": self.sample_heater_filtering,
+            "driver.lakeshore.settings.outputs.sample.autoscan_delay": self.sample_heater_autoscan_delay,
+            "driver.lakeshore.settings.outputs.sample.polarity": self.sample_heater_polarity,
+            "driver.lakeshore.settings.outputs.sample.range": ranges,
+            "driver.lakeshore.settings.outputs.sample.resistance": self.sample_heater_resistance,
+            "driver.lakeshore.settings.outputs.sample.display_units": self.sample_heater_display_units,
+            "driver.lakeshore.settings.outputs.sample.manual_value": manual_value,
+            "driver.lakeshore.settings.outputs.sample.p": float(self.sample_heater_p),
+            "driver.lakeshore.settings.outputs.sample.i": float(self.sample_heater_i),
+            "driver.lakeshore.settings.outputs.sample.d": float(self.sample_heater_d),
+            "driver.lakeshore.settings.outputs.sample.setpoint": self.sample_heater_setpoint,
+            "driver.lakeshore.settings.outputs.sample.enable_ramping": self.sample_heater_enable_ramping,
+            "driver.lakeshore.settings.outputs.sample.ramping_rate": self.sample_heater_ramping_rate,
+        }
+
+    def _update_heater(self):
+        """hand the settings which changed to the worker, it posts and confirms them"""
+        dirty = {
+            key: value for key, value in self._heater_settings().items()
+            if self.blueforsworker.requested.get(key) != value
+        }
+        if dirty:
+            self.blueforsworker.write(dirty)
+
+    def get_status(self):
+        logger.info('%s.get_status()', self._name)
 
         # get data
-        data = self.blueforsworker.data
+        data = self.blueforsworker.snapshot()
         now = time()
 
         # get heater settings
@@ -246,6 +430,7 @@ class BlueForsAPI(BaseDriver):
                 "actual_range": self.sample_heater_actual_range,
             },
             "status":{},
+            "poll": self.blueforsworker.stats(),
         }
 
         # get actual temperatures, pressures, flow and heater values
@@ -278,6 +463,7 @@ class BlueForsAPI(BaseDriver):
 
         # Save Driver Settings
         dgw.append(f"{hdf5_path}{D_STRING}", status["driver"])
+        dgw.append(f"{hdf5_path}{POLL_STRING}", {"time": status["driver"]["time"], **status["poll"]})
 
         # Save Status
         for i,d in enumerate(self.status_keys):
@@ -297,6 +483,7 @@ class BlueForsAPI(BaseDriver):
     def setPIDMode(self, pid:bool):
         logger.info('%s.setPIDMode()', self._name)
         self.sample_heater_pid_mode = pid
+        self._update_heater()
     def getPIDMode(self):
         logger.info(f'{self._name}.getPIDMode()')
         return self.sample_heater_pid_mode
@@ -304,6 +491,7 @@ class BlueForsAPI(BaseDriver):
     def setManualMode(self, manual:bool):
         logger.info('%s.setManualMode()', self._name)
         self.sample_heater_manual_mode = manual
+        self._update_heater()
     def getManualMode(self):
         logger.info(f'{self._name}.getManualMode()')
         return self.sample_heater_manual_mode
@@ -311,6 +499,7 @@ class BlueForsAPI(BaseDriver):
     def setManualValue(self, manual_value:float):
         logger.info('%s.setManualValue()', self._name)
         self.sample_heater_manual_value = manual_value
+        self._update_heater()
     def getManualValue(self):
         logger.info(f'{self._name}.getManualValue()')
         return self.sample_heater_manual_value
@@ -318,6 +507,7 @@ class BlueForsAPI(BaseDriver):
     def setSetPoint(self, setpoint:float):
         logger.info('%s.setSetPoint()', self._name)
         self.sample_heater_setpoint = setpoint
+        self._update_heater()
     def getSetPoint(self):
         logger.info('%s.getSetPoint()', self._name)
         return self.sample_heater_setpoint
@@ -325,6 +515,7 @@ class BlueForsAPI(BaseDriver):
     def setRange(self, range:int):
         logger.info('%s.setRange()', self._name)
         self.sample_heater_range = range
+        self._update_heater()
     def getRange(self):
         logger.info('%s.getRange()', self._name)
         return self.sample_heater_range
@@ -332,6 +523,7 @@ class BlueForsAPI(BaseDriver):
     def setP(self, P:float):
         logger.info('%s.setP()', self._name)
         self.sample_heater_p = P
+        self._update_heater()
     def getP(self):
         logger.info('%s.getP()', self._name)
         return self.sample_heater_p
@@ -339,6 +531,7 @@ class BlueForsAPI(BaseDriver):
     def setI(self, I:float):
         logger.info('%s.setI()', self._name)
         self.sample_heater_i = I
+        self._update_heater()
     def getI(self):
         logger.info('%s.getI()', self._name)
         return self.sample_heater_i
@@ -346,6 +539,7 @@ class BlueForsAPI(BaseDriver):
     def setD(self, D:float):
         logger.info('%s.setD()', self._name)
         self.sample_heater_d = D
+        self._update_heater()
     def getD(self):
         logger.info('%s.getD()', self._name)
         return self.sample_heater_d
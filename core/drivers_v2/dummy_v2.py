@@ -83,7 +83,8 @@ class Dummy(BaseDriver):
 
     def get_state(self):
         logger.info('%s.get_state()', self._name)
-        return 1
+        # holding, there is nothing to wait for
+        return 2
 
     def set_rate(self, rate: float):
         logger.info('%s.set_rate()', self._name)
@@ -92,6 +93,10 @@ class Dummy(BaseDriver):
         logger.info('%s.get_rate()', self._name)
         return np.nan
 
+    def get_ramp_rate(self):
+        logger.info('%s.get_ramp_rate()', self._name)
+        return np.nan
+
     def set_target_field(self, target: float):
         logger.info('%s.set_target_field(%f)', self._name, target)
 
@@ -1,5 +1,9 @@
 from .lnspc import LnSpcPlotConfig
+from .pyramid import PyramidPlotConfig
 
 # configure plot configs to work with p5control
 from p5control.gui import setPlotConfigOption
-setPlotConfigOption('lnspc', LnSpcPlotConfig)
\ No newline at end of file
+setPlotConfigOption('lnspc', LnSpcPlotConfig)
+setPlotConfigOption('pyramid', PyramidPlotConfig)
+
+from .gateway import LocalDataGateway
@@ -0,0 +1,166 @@
+"""
+Data gateway for viewers on the measurement PC, which read flushed rows straight from the hdf5
+file on disk instead of copying them through rpyc. The data server is asked for all other rows
+and for the change notifications.
+
+Reading a file while a non SWMR writer has it open is not safe (see hdf5safe.LiveFile), so local
+reads are opt-in and only used with a FlushCheckpointer running in the server.
+"""
+import os
+import time
+import logging
+from threading import Lock
+
+import h5py
+import numpy as np
+
+from p5control.gui import GuiDataGateway
+from p5control.settings import DATASERV_DEFAULT_PORT
+
+from core.utilities.hdf5safe import LiveFile, FLUSH_COUNT_ATTR, FLUSHED_ATTR
+
+logger = logging.getLogger(__name__)
+
+class LocalDataGateway(GuiDataGateway):
+    """GuiDataGateway which can serve ``get_data`` from the local file.
+
+    The file of the data server is opened read only through LiveFile and reopened at most every
+    ``reopen`` seconds. Its rows are only used if the ``flush_count`` on disk is the one the data
+    server reports, and only below the ``flushed`` length of the dataset (FlushCheckpointer).
+    Everything else, negative indices, indices other than slices and any read error go to the
+    data server as before. If the file is not on this PC or ``local`` is False, the gateway
+    behaves like GuiDataGateway.
+
+    Parameters
+    ----------
+    local : bool
+        read flushed rows from the local file, off by default
+    directory : str, optional
+        local directory of the data server files, if it differs from the one the server reports
+    reopen : float
+        seconds after which the local file is opened again
+    """
+    def __init__(
+        self,
+        addr: str = 'localhost',
+        port: int = DATASERV_DEFAULT_PORT,
+        conn_timeout: float = 0.0,
+        allow_callback: bool = False,
+        local: bool = False,
+        directory: str = None,
+        reopen: float = 1.,
+    ):
+        super().__init__(addr, port, conn_timeout, allow_callback)
+        self.local = local
+        self.directory = directory
+        self.reopen = reopen
+
+        self._live = None
+        self._local_f = None
+        self._opened = 0
+        self._local_lock = Lock()
+
+        self.local_reads = 0
+        self.remote_reads = 0
+
+    def connect(self, config=None):
+        super().connect(config)
+        with self._local_lock:
+            self._close_local()
+
+    def disconnect(self):
+        with self._local_lock:
+            self._close_local()
+        super().disconnect()
+
+    def _close_local(self):
+        if self._local_f is not None:
+            self._local_f.close()
+        if self._live is not None:
+            self._live.close()
+        self._local_f = None
+        self._live = None
+
+    def _local_file(self):
+        """The local file, reopened if it is older than ``reopen``."""
+        if not self.local or self.dataserv_filename is None:
+            return None
+
+        now = time.time()
+        if now - self._opened < self.reopen:
+            return self._local_f
+        self._close_local()
+        self._opened = now
+
+        # the server switches files on a rollover, see core.utilities.segments
+        filename = self.filename
+        if self.directory is not None:
+            filename = os.path.join(self.directory, os.path.basename(filename))
+
+        if not os.path.exists(filename):
+            logger.info('LocalDataGateway "%s" is not on this PC, reading through the data server.', filename)
+            self.local = False
+            return None
+        try:
+            self._live = LiveFile(filename)
+            self._local_f = h5py.File(self._live, 'r', locking=False)
+            count = self._local_f.attrs.get(FLUSH_COUNT_ATTR, None)
+            # the disk has to hold the last flush of the server
+            if count is None or count != self.get('/').attrs.get(FLUSH_COUNT_ATTR, None):
+                logger.debug('LocalDataGateway "%s" is not at the last flush.', filename)
+                self._close_local()
+                return None
+        except (OSError, ValueError, KeyError) as e:
+            # e.g. the server is just flushing, try again after reopen
+            logger.debug('LocalDataGateway cannot open "%s": %s', filename, e)
+            self._close_local()
+        return self._local_f
+
+    def _get_local(self, path, indices, field):
+        """Rows of the slice which are on disk, and the slice of the remaining rows."""
+        if indices == ():
+            indices = slice(None)
+        if not isinstance(indices, slice):
+            return None, indices
+        # negative indices count from the end on the server, leave them to it
+        start = 0 if indices.start is None else indices.start
+        stop, step = indices.stop, 1 if indices.step is None else indices.step
+        if start < 0 or (stop is not None and stop < 0) or step <= 0:
+            return None, indices
+
+        f = self._local_file()
+        if f is None:
+            return None, indices
+        try:
+            dset = f[path]
+            # rows of the last flush
+            flushed = int(dset.attrs.get(FLUSHED_ATTR, 0))
+            split = flushed if stop is None else min(flushed, stop)
+            if split <= start:
+                return None, indices
+            source = dset.fields(field) if field else dset
+            data = source[start:split:step]
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug('LocalDataGateway local read of "%s" failed: %s', path, e)
+            self._close_local()
+            return None, indices
+
+        # continue the step pattern behind the flushed rows
+        if stop is None or split < stop:
+            first = start + len(data) * step
+            return data, slice(first, stop, step)
+        return data, None
+
+    def get_data(self, path, indices: slice = (), field: str = None):
+        with self._local_lock:
+            data, rest = self._get_local(path, indices, field)
+
+        if data is None:
+            self.remote_reads += 1
+            return super().get_data(path, indices, field)
+
+        self.local_reads += 1
+        if rest is None:
+            return data
+        tail = super().get_data(path, rest, field)
+        return np.concatenate((data, tail))
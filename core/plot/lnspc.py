@@ -24,7 +24,8 @@ class LnSpcPlotConfig(BasePlotConfig):
         compound_names = node.dtype.names
         ndim = node.shape
 
-        self._config["data"] = dgw.get_data(path)
+        # only the last row is plotted
+        self._config["data"] = dgw.get_data(path, slice(-1, None))
         self._config["x_data"] = np.linspace(
                                     float(node.attrs["start"]),
                                     float(node.attrs["stop"]),
@@ -39,7 +40,8 @@ class LnSpcPlotConfig(BasePlotConfig):
         self.callid = self.dgw.register_callback(path, self.callback)
 
     def callback(self, data):
-        data = obtain(data)
+        # copy only the last row of the appended ones
+        data = obtain(data[-1:])
 
         with self._config["lock"]:
             self._config["data"] = data
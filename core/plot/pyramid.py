@@ -0,0 +1,141 @@
+import re
+import time
+
+import numpy as np
+from rpyc.utils.classic import obtain
+
+from p5control import DataGateway
+from p5control.gui import BasePlotConfig
+
+
+class PyramidPlotConfig(BasePlotConfig):
+    """
+    Plot config for a time series with decimated levels <base>_<factor>x next to it. On every
+    update the finest level with at most ``max_points`` rows in the visible time span is read,
+    levels are drawn as min/max envelope. Works on the base dataset or any of its levels.
+    """
+    def __init__(
+        self,
+        dgw: DataGateway,
+        path: str,
+        *args,
+        max_points: int = 5000,
+        refresh: float = 1.,
+        **kwargs
+    ):
+        super().__init__(dgw, path, *args, **kwargs)
+
+        self.dgw = dgw
+        self.max_points = max_points
+        self.refresh = refresh
+
+        node = dgw.get(path)
+        parent_path = path.rsplit("/", 1)[0]
+        base = node.attrs["pyramid_base"] if "pyramid_base" in node.attrs else path.rsplit("/", 1)[1]
+
+        # (factor, path), the base only if it has timestamps
+        self.levels = []
+        base_path = f"{parent_path}/{base}"
+        try:
+            if "time" in dgw.get(base_path).dtype.names:
+                self.levels.append((1, base_path))
+        except KeyError:
+            pass
+        pattern = re.compile(rf"^{re.escape(base)}_(\d+)x$")
+        for key in dgw.get(parent_path).keys():
+            match = pattern.match(key)
+            if match:
+                self.levels.append((int(match.group(1)), f"{parent_path}/{key}"))
+        self.levels.sort()
+
+        names = [name for name in node.dtype.names if name not in ("time", "n")]
+        self._config["x"] = "time"
+        self._config["y"] = re.sub(r"_(min|max|mean)$", "", names[0])
+        self._config["level"] = None
+
+        self.fetched_range = None
+        self.fetched_time = 0
+        # path -> (first time, time per row, length the time per row was measured at)
+        self._extents = {}
+        self.x_data = np.empty(0)
+        self.y_data = np.empty(0)
+
+    def _extent(self, path):
+        """first time, last time and length of a dataset. The first time is read once, the
+        time per row again once the dataset doubled in length, otherwise only the length."""
+        length = self.dgw.get(path).shape[0]
+        if length == 0:
+            return None
+        cached = self._extents.get(path, None)
+        if cached is None or length >= 2 * cached[2]:
+            if cached is None:
+                first = float(self.dgw.get_data(path, slice(0, 1), field="time")[0])
+            else:
+                first = cached[0]
+            last = float(self.dgw.get_data(path, slice(length-1, length), field="time")[0])
+            period = (last - first) / (length - 1) if length > 1 else 0.
+            cached = (first, period, length)
+            self._extents[path] = cached
+        first, period, _ = cached
+        return first, first + (length - 1) * period, length
+
+    def _fetch(self, x0, x1):
+        span = x1 - x0
+        choice = None
+        for factor, path in self.levels:
+            extent = self._extent(path)
+            if extent is None:
+                continue
+            first, last, length = extent
+            choice = (factor, path, first, last, length)
+            duration = max(last - first, 1e-9)
+            if length * span / duration <= self.max_points:
+                break
+        if choice is None:
+            return
+
+        # rows are about evenly spaced, read the visible ones plus a margin
+        factor, path, first, last, length = choice
+        duration = max(last - first, 1e-9)
+        i0 = int((x0 - first) / duration * length) - 10
+        i1 = int((x1 - first) / duration * length) + 10
+        i0, i1 = max(i0, 0), min(i1, length)
+        if i1 <= i0:
+            data = None
+        else:
+            data = obtain(self.dgw.get_data(path, slice(i0, i1)))
+
+        # a level column may have been chosen in the plot form
+        y = re.sub(r"_(min|max|mean)$", "", self._config["y"])
+        if data is None:
+            x_data, y_data = np.empty(0), np.empty(0)
+        elif factor == 1:
+            x_data, y_data = data["time"], data[y]
+        else:
+            # envelope: min and max at the time of each row
+            x_data = np.repeat(data["time"], 2)
+            y_data = np.empty(2 * len(data))
+            y_data[0::2] = data[f"{y}_min"]
+            y_data[1::2] = data[f"{y}_max"]
+
+        with self._config["lock"]:
+            self._config["level"] = factor
+            self.x_data, self.y_data = x_data, y_data
+
+    def update(self):
+        plotDataItem = self._config["plotDataItem"]
+        viewBox = plotDataItem.getViewBox()
+        if viewBox is None:
+            return
+
+        # x axis is time relative to now, like PlotConfig
+        now = time.time()
+        x0, x1 = viewBox.viewRange()[0]
+        view = (round(x0, 3), round(x1, 3))
+        if view != self.fetched_range or now - self.fetched_time > self.refresh:
+            self._fetch(x0 + now, x1 + now)
+            self.fetched_range = view
+            self.fetched_time = now
+
+        with self._config["lock"]:
+            plotDataItem.setData(self.x_data - now, self.y_data)
@@ -0,0 +1,10 @@
+"""
+Streaming processing stages for the ADwin data
+"""
+from .didv import DifferentialConductance
+from .sweeps import SweepSegmenter, SEGMENT_DTYPE
+from .binning import SweepBinner
+from .lockin import DigitalLockIn
+from .timebase import TimebaseEncoder, TIMEBASE_DTYPE, timestamps, value_dtype
+from .stats import chunk_stats, stats_dtype, OVERLOAD_LEVEL
+from .pyramid import Pyramid, level_dtype
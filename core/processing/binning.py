@@ -0,0 +1,97 @@
+"""
+Streaming binning of I over V per sweep on a linspace (lnspc) grid.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SweepBinner:
+    """Bins the current of every sweep over the voltage while the sweep is running.
+
+    Same result as bin_y_over_x of calculator2: bin k holds the mean current of all
+    samples with bins[k] <= V < bins[k+1], where bins = np.linspace(start, stop, points)
+    and the last bin is as wide as the one before. Only the running sums and counts of the
+    current sweep are kept, so memory is O(points) independent of the sweep length.
+
+    A sweep is finished when the trigger changes. Samples with trigger <= 0 (no output,
+    constant voltage) are not binned.
+
+    Parameters
+    ----------
+    start : float
+        first bin
+    stop : float
+        last bin
+    points : int
+        number of bins
+    """
+    def __init__(self, start: float = -1e-3, stop: float = 1e-3, points: int = 201):
+        self.set_grid(start, stop, points)
+
+    def set_grid(self, start: float, stop: float, points: int):
+        """Change the bins, drops the running sweep."""
+        points = max(int(points), 2)
+        self.start = float(start)
+        self.stop = float(stop)
+        self.points = points
+        bins = np.linspace(self.start, self.stop, points)
+        self.edges = np.append(bins, 2 * bins[-1] - bins[-2])
+        self.dtype = np.dtype([
+            ('time', '<f8'),
+            ('current', '<f8', (points,)),
+            ('case', '<i8'),
+        ])
+        self.reset()
+
+    def reset(self):
+        """Drop the running sweep, e.g. when a new measurement starts."""
+        self.trigger = None
+        self.sum = np.zeros(self.points)
+        self.count = np.zeros(self.points)
+        self.t_first = np.nan
+        self.t_last = np.nan
+
+    def process(self, t, V, I, trigger):
+        """Add a chunk and return the sweeps finished by it as array of self.dtype."""
+        trigger = np.asarray(trigger)
+        rows = []
+        # split the chunk at turning points
+        edges = np.flatnonzero(np.diff(trigger)) + 1
+        for start, stop in zip(np.r_[0, edges], np.r_[edges, len(trigger)]):
+            if trigger[start] != self.trigger:
+                if self.trigger is not None and self.trigger > 0:
+                    rows.append(self._finish())
+                self.reset()
+                self.trigger = trigger[start]
+            if self.trigger <= 0:
+                continue
+            self._add(t[start:stop], V[start:stop], I[start:stop])
+
+        sweeps = np.empty(len(rows), dtype=self.dtype)
+        for i, row in enumerate(rows):
+            sweeps[i] = row
+        return sweeps
+
+    def _add(self, t, V, I):
+        if np.isnan(self.t_first):
+            self.t_first = t[0]
+        self.t_last = t[-1]
+
+        index = np.searchsorted(self.edges, V, side='right') - 1
+        # np.histogram includes the right edge of the last bin
+        index[V == self.edges[-1]] = self.points - 1
+        inside = (index >= 0) & (index < self.points)
+        index = index[inside]
+        self.sum += np.bincount(index, weights=I[inside], minlength=self.points)
+        self.count += np.bincount(index, minlength=self.points)
+
+    def _finish(self):
+        count = self.count.copy()
+        count[count == 0] = np.nan
+        return (
+            (self.t_first + self.t_last) / 2,
+            self.sum / count,
+            self.trigger,
+        )
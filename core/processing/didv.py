@@ -0,0 +1,108 @@
+"""
+Streaming differential conductance dI/dV over chunks of sweep data.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def moving_average(x, window):
+    """Moving average in 'valid' mode, result[k] belongs to x[k + (window-1)//2]."""
+    c = np.cumsum(np.concatenate(([0.], x)))
+    return (c[window:] - c[:-window]) / window
+
+class DifferentialConductance:
+    """Computes dI/dV of a sweep chunk by chunk.
+
+    V and I are smoothed with a moving average of ``window`` samples, then dI/dV is taken as
+    central difference over ``window`` samples of the smoothed curves. Every sample therefore
+    needs ``window-1`` samples on each side, which are carried over to the next chunk. The
+    stream is split into segments where the trigger changes (turning points of the sweep),
+    the ``window-1`` samples at both ends of a segment are not evaluated. Segments with
+    trigger <= 0 (no output, constant voltage) are skipped.
+
+    Memory is bounded by the chunk size plus ``2*(window-1)`` samples.
+
+    Parameters
+    ----------
+    window : int
+        odd number of samples >= 3 for smoothing and difference
+    """
+    def __init__(self, window: int = 21):
+        self.set_window(window)
+
+    def set_window(self, window: int):
+        window = max(int(window), 3)
+        if window % 2 == 0:
+            window += 1
+        self.window = window
+        self.half = (window - 1) // 2
+        self.reset()
+
+    def reset(self, row: int = 0):
+        """Start counting samples at ``row`` and forget the carried over samples, e.g. when a
+        new measurement starts."""
+        self.row = int(row)
+        self._segment(None)
+
+    def _segment(self, trigger):
+        self.trigger = trigger
+        self.rows = np.empty(0, dtype='int64')
+        self.t = np.empty(0)
+        self.V = np.empty(0)
+        self.I = np.empty(0)
+
+    def process(self, t, V, I, trigger):
+        """Add a chunk and return (rows, t, V, I, dIdV) of all samples that can be evaluated
+        now. rows counts the samples given since the last reset, V and I are the smoothed
+        values."""
+        trigger = np.asarray(trigger)
+        out = []
+        # split the chunk at turning points
+        edges = np.flatnonzero(np.diff(trigger)) + 1
+        for start, stop in zip(np.r_[0, edges], np.r_[edges, len(trigger)]):
+            if trigger[start] != self.trigger:
+                self._segment(trigger[start])
+            if self.trigger <= 0:
+                continue
+            self.rows = np.concatenate((self.rows, self.row + np.arange(start, stop)))
+            self.t = np.concatenate((self.t, t[start:stop]))
+            self.V = np.concatenate((self.V, V[start:stop]))
+            self.I = np.concatenate((self.I, I[start:stop]))
+            out.append(self._evaluate())
+        self.row += len(trigger)
+
+        if not out:
+            return (np.empty(0, dtype='int64'),) + tuple(np.empty(0) for _ in range(4))
+        return tuple(np.concatenate(columns) for columns in zip(*out))
+
+    def _evaluate(self):
+        h = self.half
+        context = 4 * h
+        n = len(self.t)
+        if n <= context:
+            return (np.empty(0, dtype='int64'),) + tuple(np.empty(0) for _ in range(4))
+
+        sV = moving_average(self.V, self.window)
+        sI = moving_average(self.I, self.window)
+        dV = sV[2*h:] - sV[:-2*h]
+        dI = sI[2*h:] - sI[:-2*h]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dIdV = np.where(dV != 0, dI / dV, np.nan)
+
+        # evaluated samples 2h .. n-1-2h, smoothed values of these are sV[h:-h]
+        result = (
+            self.rows[2*h:n-2*h],
+            self.t[2*h:n-2*h],
+            sV[h:len(sV)-h],
+            sI[h:len(sI)-h],
+            dIdV,
+        )
+
+        # carry over what the next evaluated sample needs
+        self.rows = self.rows[-context:]
+        self.t = self.t[-context:]
+        self.V = self.V[-context:]
+        self.I = self.I[-context:]
+        return result
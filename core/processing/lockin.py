@@ -0,0 +1,122 @@
+"""
+Streaming digital lock-in for the ADwin channels.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class DigitalLockIn:
+    """Demodulates chunks of samples at harmonics of a reference frequency.
+
+    The reference phase advances by 2 pi f / sample_rate per sample and is carried over
+    between chunks, so the demodulated values do not jump at chunk borders. Every channel
+    is mixed with cos and sin of h times the reference phase for every harmonic h. The
+    products are averaged over ``decimation`` samples (boxcar, the remainder of a chunk is
+    kept for the next one) and then filtered by ``order`` cascaded first order low-passes
+    with ``time_constant`` at the decimated rate.
+
+    For a channel A cos(h phase + theta) the output is X = A cos(theta), Y = A sin(theta).
+
+    Parameters
+    ----------
+    frequency : float
+        reference frequency in Hz
+    harmonics : tuple of int
+        harmonics to demodulate
+    time_constant : float
+        time constant of the low-pass in s, 0 disables it
+    order : int
+        number of cascaded low-pass stages
+    decimation : int
+        samples per output row
+    """
+    def __init__(
+            self,
+            frequency: float = 17.77,
+            harmonics = (1,),
+            time_constant: float = .1,
+            order: int = 2,
+            decimation: int = 1000,
+            ):
+        self.frequency = frequency
+        self.harmonics = tuple(int(h) for h in harmonics)
+        self.time_constant = time_constant
+        self.order = max(int(order), 1)
+        self.decimation = max(int(decimation), 1)
+        self.reset()
+
+    def reset(self):
+        """Start at phase 0 without filter state, e.g. when a new measurement starts."""
+        self.phase = 0.
+        # mixed products and times not yet filling a decimation block
+        self.rest = None
+        self.rest_t = np.empty(0)
+        # low-pass stages, one row per stage
+        self.state = None
+
+    def names(self, channels):
+        """Field names of the output for the given channel names, e.g. X1, Y1, X1_2f."""
+        names = []
+        for h in self.harmonics:
+            suffix = '' if h == 1 else f'_{h}f'
+            for ch in channels:
+                names += [f'X{ch}{suffix}', f'Y{ch}{suffix}']
+        return names
+
+    def process(self, t, x, sample_rate):
+        """Add a chunk and return (t, XY) of all completed output rows.
+
+        x has one column per channel, XY holds X and Y of every harmonic and channel in the
+        order of names().
+        """
+        t = np.asarray(t, dtype='float64')
+        x = np.asarray(x, dtype='float64')
+        if x.ndim == 1:
+            x = x[:, None]
+        n = len(t)
+
+        # reference phase of every sample, continued from the last chunk
+        step = 2 * np.pi * self.frequency / sample_rate
+        phase = self.phase + step * np.arange(n)
+        self.phase = float((self.phase + step * n) % (2 * np.pi))
+
+        columns = []
+        for h in self.harmonics:
+            c = 2 * np.cos(h * phase)
+            s = -2 * np.sin(h * phase)
+            for k in range(x.shape[1]):
+                columns += [x[:, k] * c, x[:, k] * s]
+        mixed = np.stack(columns, axis=1)
+
+        if self.rest is not None:
+            mixed = np.concatenate((self.rest, mixed))
+            t = np.concatenate((self.rest_t, t))
+
+        # boxcar over decimation samples
+        d = self.decimation
+        m = len(t) // d
+        self.rest = mixed[m * d:]
+        self.rest_t = t[m * d:]
+        if m == 0:
+            return np.empty(0), np.empty((0, mixed.shape[1]))
+        t_out = t[:m * d].reshape(m, d).mean(axis=1)
+        xy = mixed[:m * d].reshape(m, d, -1).mean(axis=1)
+
+        return t_out, self._low_pass(xy, d / sample_rate)
+
+    def _low_pass(self, xy, dt):
+        if self.time_constant <= 0:
+            return xy
+        alpha = 1 - np.exp(-dt / self.time_constant)
+        if self.state is None or self.state.shape[1] != xy.shape[1]:
+            self.state = np.tile(xy[0], (self.order, 1))
+        out = np.empty_like(xy)
+        # decimated rate, only a few rows per chunk
+        for i, row in enumerate(xy):
+            for stage in self.state:
+                stage += alpha * (row - stage)
+                row = stage
+            out[i] = row
+        return out
@@ -0,0 +1,93 @@
+"""
+Multi-resolution min/max/mean levels of a time series, built while the data arrives.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def level_dtype(fields):
+    """time, n and min, max, mean of every field."""
+    dtype = [('time', '<f8'), ('n', '<i8')]
+    for field in fields:
+        dtype += [
+            (f'{field}_min', '<f8'),
+            (f'{field}_max', '<f8'),
+            (f'{field}_mean', '<f8'),
+        ]
+    return np.dtype(dtype)
+
+class Pyramid:
+    """Decimates a stream of samples into levels of ``factors`` samples per row.
+
+    The first level is reduced from the samples, every further level from the rows of the
+    level before, so each factor has to be a multiple of the previous one. Samples and rows
+    not filling a block yet are carried over to the next chunk, at most one block per level.
+
+    Parameters
+    ----------
+    fields : list of str
+        names of the columns to reduce
+    factors : tuple of int
+        samples per row of each level, e.g. (10, 100, 1000)
+    """
+    def __init__(self, fields, factors=(10, 100, 1000)):
+        self.fields = list(fields)
+        self.set_factors(factors)
+
+    def set_factors(self, factors):
+        factors = sorted(int(f) for f in factors)
+        for a, b in zip(factors, factors[1:]):
+            if b % a:
+                raise ValueError(f'pyramid factor {b} is no multiple of {a}')
+        self.factors = tuple(factors)
+        self.dtype = level_dtype(self.fields)
+        self.reset()
+
+    def reset(self):
+        """Drop the carried over samples, e.g. when a new measurement starts."""
+        self.rest_t = np.empty(0)
+        self.rest = {field: np.empty(0) for field in self.fields}
+        self.rest_rows = [np.empty(0, dtype=self.dtype) for _ in self.factors]
+
+    def process(self, t, columns: dict):
+        """Add a chunk and return a list with the new rows of every level."""
+        t = np.concatenate((self.rest_t, np.asarray(t, dtype='float64')))
+        columns = {
+            field: np.concatenate((self.rest[field], np.asarray(columns[field], dtype='float64')))
+            for field in self.fields
+        }
+
+        # first level from the samples
+        f = self.factors[0]
+        m = len(t) // f
+        rows = np.empty(m, dtype=self.dtype)
+        rows['time'] = t[:m * f].reshape(m, f).mean(axis=1)
+        rows['n'] = f
+        for field in self.fields:
+            x = columns[field][:m * f].reshape(m, f)
+            rows[f'{field}_min'] = x.min(axis=1)
+            rows[f'{field}_max'] = x.max(axis=1)
+            rows[f'{field}_mean'] = x.mean(axis=1)
+        self.rest_t = t[m * f:]
+        self.rest = {field: columns[field][m * f:] for field in self.fields}
+
+        levels = [rows]
+        # further levels from the level before
+        for i in range(1, len(self.factors)):
+            r = self.factors[i] // self.factors[i - 1]
+            rows = np.concatenate((self.rest_rows[i], levels[-1]))
+            m = len(rows) // r
+            blocks = rows[:m * r].reshape(m, r)
+            self.rest_rows[i] = rows[m * r:]
+
+            rows = np.empty(m, dtype=self.dtype)
+            rows['time'] = blocks['time'].mean(axis=1)
+            rows['n'] = self.factors[i]
+            for field in self.fields:
+                rows[f'{field}_min'] = blocks[f'{field}_min'].min(axis=1)
+                rows[f'{field}_max'] = blocks[f'{field}_max'].max(axis=1)
+                rows[f'{field}_mean'] = blocks[f'{field}_mean'].mean(axis=1)
+            levels.append(rows)
+        return levels
@@ -0,0 +1,73 @@
+"""
+Statistics of a chunk of ADwin data, computed once per chunk and shared by all consumers.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# inputs of the ADwin are +-10V, values beyond this count as overload
+OVERLOAD_LEVEL = 9.5
+# samples reduced at once, small enough to stay in the cache
+BLOCK = 4096
+
+def stats_dtype(channels):
+    """time, n and min, max, mean, var, ovls (overload count) of every channel."""
+    fields = [('time', '<f8'), ('n', '<i8')]
+    for ch in channels:
+        fields += [
+            (f'{ch}_min', '<f8'),
+            (f'{ch}_max', '<f8'),
+            (f'{ch}_mean', '<f8'),
+            (f'{ch}_var', '<f8'),
+            (f'{ch}_ovls', '<i8'),
+        ]
+    return np.dtype(fields)
+
+def moments(x):
+    """min, max, mean and variance of x.
+
+    x is read from memory once, in blocks of BLOCK samples. Every block gives its mean and sum of
+    squared deviations from it, the blocks are merged with the pairwise update of Chan et al.,
+    so a small noise on a large offset keeps its precision.
+    """
+    n, mn, mx, mean, m2 = 0, np.inf, -np.inf, 0., 0.
+    for i in range(0, len(x), BLOCK):
+        block = np.asarray(x[i:i+BLOCK], dtype='float64')
+        k = len(block)
+        block_mean = block.sum() / k
+        d = block - block_mean
+        delta = block_mean - mean
+        total = n + k
+        mean += delta * k / total
+        m2 += np.dot(d, d) + delta**2 * n * k / total
+        n = total
+        mn = min(mn, block.min())
+        mx = max(mx, block.max())
+    return mn, mx, mean, m2 / n
+
+def chunk_stats(t, columns: dict, level: float = OVERLOAD_LEVEL):
+    """One row of stats_dtype(columns) for a chunk, see moments. Overloads are only counted if
+    min or max are beyond ``level``, so a chunk without overload is not scanned again.
+    """
+    row = np.zeros(1, dtype=stats_dtype(columns))
+    t = np.asarray(t)
+    n = len(t)
+    row['n'] = n
+    if n == 0:
+        row['time'] = np.nan
+        return row[0]
+    row['time'] = (t[0] + t[-1]) / 2
+
+    for ch, x in columns.items():
+        # lists are converted once, arrays (e.g. fields of the chunk) block by block
+        x = x if isinstance(x, np.ndarray) else np.asarray(x, dtype='float64')
+        mn, mx, mean, var = moments(x)
+        row[f'{ch}_min'] = mn
+        row[f'{ch}_max'] = mx
+        row[f'{ch}_mean'] = mean
+        row[f'{ch}_var'] = var
+        if mx >= level or mn <= -level:
+            row[f'{ch}_ovls'] = np.count_nonzero(np.abs(x) >= level)
+    return row[0]
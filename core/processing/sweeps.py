@@ -0,0 +1,122 @@
+"""
+Streaming sweep segmentation of the ADwin trigger channel.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# case of a segment, see calculator2: odd sweep counts are up sweeps, even ones down sweeps
+CASE_OFF = 0
+CASE_CV = -1
+
+SEGMENT_DTYPE = np.dtype([
+    ('start', '<i8'),
+    ('stop', '<i8'),
+    ('case', '<i8'),
+    ('start_time', '<f8'),
+    ('stop_time', '<f8'),
+])
+
+def direction(case):
+    """'up', 'down', 'off' or 'cv' of a segment case."""
+    if case == CASE_OFF:
+        return 'off'
+    if case < 0:
+        return 'cv'
+    return 'up' if case % 2 == 1 else 'down'
+
+class SweepSegmenter:
+    """Splits the sample stream into up/down/idle segments chunk by chunk.
+
+    A new segment starts where the trigger changes. Segments without sweep (trigger <= 0)
+    are additionally split every ``cv_time`` seconds, like get_startstop of adwingold2_v4.
+    ``start`` and ``stop`` are row indices (stop inclusive) counted from the last reset,
+    i.e. rows of the adwin dataset of the running measurement.
+
+    Only the open segment is carried over between chunks. A chunk returns the segments
+    it closed, the segment still open at the end of the measurement is not returned.
+
+    Parameters
+    ----------
+    cv_time : float
+        split segments with trigger <= 0 after this many seconds
+    """
+    def __init__(self, cv_time: float = 1.):
+        self.cv_time = cv_time
+        self.reset()
+
+    def reset(self):
+        """Start counting at row 0 without open segment, e.g. when a new measurement starts."""
+        self.index = 0
+        # open segment
+        self.case = None
+        self.start = 0
+        self.start_time = np.nan
+        # time of the trigger change and cv block of the open segment
+        self.ref_time = np.nan
+        self.block = 0
+        self.last_time = np.nan
+
+    def process(self, t, trigger):
+        """Add a chunk and return the segments closed by it as SEGMENT_DTYPE array."""
+        t = np.asarray(t, dtype='float64')
+        trigger = np.asarray(trigger)
+        n = len(trigger)
+        if n == 0:
+            return np.empty(0, dtype=SEGMENT_DTYPE)
+
+        # trigger changes, including the change against the previous chunk
+        change = np.empty(n, dtype=bool)
+        change[0] = self.case is None or trigger[0] != self.case
+        np.not_equal(trigger[1:], trigger[:-1], out=change[1:])
+
+        # time of the trigger change each sample belongs to
+        change_pos = np.flatnonzero(change)
+        seg_id = np.cumsum(change) - 1
+        ref_times = t[change_pos]
+        if not change[0]:
+            ref_times = np.r_[self.ref_time, ref_times]
+            seg_id += 1
+        ref = ref_times[seg_id]
+
+        # cv blocks of segments without sweep
+        block = np.zeros(n, dtype='int64')
+        idle = trigger <= 0
+        if self.cv_time > 0:
+            block[idle] = np.floor((t[idle] - ref[idle]) / self.cv_time)
+        new_block = np.empty(n, dtype=bool)
+        new_block[0] = block[0] != self.block
+        np.not_equal(block[1:], block[:-1], out=new_block[1:])
+        new = change | (idle & new_block)
+
+        # rows of all segments touched by this chunk, starting with the open one
+        pos = np.flatnonzero(new)
+        starts = self.index + pos
+        cases = trigger[pos].astype('int64')
+        start_times = t[pos]
+        if self.case is not None:
+            starts = np.r_[self.start, starts]
+            cases = np.r_[self.case, cases]
+            start_times = np.r_[self.start_time, start_times]
+        # time of the sample before each new segment
+        stop_times = np.r_[self.last_time, t][pos]
+
+        # all but the last segment are closed now
+        closed = np.empty(len(starts) - 1, dtype=SEGMENT_DTYPE)
+        if len(closed):
+            closed['start'] = starts[:-1]
+            closed['stop'] = starts[1:] - 1
+            closed['case'] = cases[:-1]
+            closed['start_time'] = start_times[:-1]
+            closed['stop_time'] = stop_times[-len(closed):]
+
+        self.case = cases[-1]
+        self.start = starts[-1]
+        self.start_time = start_times[-1]
+        self.ref_time = ref[-1]
+        self.block = block[-1]
+        self.last_time = t[-1]
+        self.index += n
+        return closed
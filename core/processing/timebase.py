@@ -0,0 +1,99 @@
+"""
+Compact timebase of evenly spaced samples: (t0, dt, n) records instead of one time per sample.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# one record per run of evenly spaced samples, gap is the time missing before t0
+TIMEBASE_DTYPE = np.dtype([
+    ('start', '<i8'),
+    ('n', '<i8'),
+    ('t0', '<f8'),
+    ('dt', '<f8'),
+    ('gap', '<f8'),
+])
+
+# resolution of the ADwin ADCs and of the float32 mantissa
+ADC_BITS = 16
+FLOAT32_BITS = 24
+
+def value_dtype(averaging: int):
+    """float32 if the mean of ``averaging`` ADC values fits into its mantissa, else float64."""
+    bits = ADC_BITS + np.log2(max(int(averaging), 1))
+    return np.dtype('<f4') if bits <= FLOAT32_BITS else np.dtype('<f8')
+
+class TimebaseEncoder:
+    """Describes the timestamps of a stream of chunks by TIMEBASE_DTYPE records.
+
+    The ADwin accumulates its time as float32, so the timestamps carry rounding errors of the
+    order of the float32 spacing at t and their step differs from the nominal 1/sample_rate.
+    The step is therefore estimated per chunk as the median difference, and a record runs as
+    long as every difference is within half a step plus twice the float32 spacing of it.
+    Each record gets the mean step of its own samples as dt. Every chunk gives at least one
+    record starting at its first sample. ``gap`` is the time missing (negative: overlapping)
+    between the end of the previous record and t0, so gaps are marked in place. ``start`` is
+    the row index of the first sample, counted from the last reset.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start at row 0, e.g. when a new measurement starts."""
+        self.index = 0
+        # expected time of the next sample
+        self.next_time = np.nan
+
+    def process(self, t, dt):
+        """Add the timestamps of a chunk and return its records, ``dt`` is the nominal step,
+        used if the chunk has no usable differences."""
+        t = np.asarray(t, dtype='float64')
+        n = len(t)
+        if n == 0:
+            return np.zeros(0, dtype=TIMEBASE_DTYPE)
+
+        diff = np.diff(t)
+        step = np.median(diff) if n > 1 else dt
+        if not step > 0:
+            step = dt
+        tolerance = step / 2 + 2 * np.spacing(np.abs(t[1:]).astype('float32')).astype('float64')
+        breaks = np.flatnonzero(np.abs(diff - step) > tolerance) + 1
+
+        starts = np.concatenate(([0], breaks))
+        stops = np.concatenate((breaks, [n]))
+        counts = stops - starts
+        t0 = t[starts]
+        steps = np.full(len(starts), float(step))
+        runs = counts > 1
+        steps[runs] = (t[stops[runs] - 1] - t0[runs]) / (counts[runs] - 1)
+
+        ends = t0 + counts * steps
+        gaps = np.empty(len(starts))
+        gaps[0] = 0. if np.isnan(self.next_time) else t0[0] - self.next_time
+        gaps[1:] = t0[1:] - ends[:-1]
+        self.next_time = ends[-1]
+
+        rows = np.empty(len(starts), dtype=TIMEBASE_DTYPE)
+        rows['start'] = self.index + starts
+        rows['n'] = counts
+        rows['t0'] = t0
+        rows['dt'] = steps
+        rows['gap'] = gaps
+        self.index += n
+        return rows
+
+def timestamps(records, rows=None):
+    """Timestamps of the given rows (slice or index array, default all), rebuilt from the
+    records of a timebase dataset."""
+    records = np.asarray(records)
+    end = records['start'][-1] + records['n'][-1] if len(records) else 0
+    if rows is None:
+        rows = np.arange(end)
+    elif isinstance(rows, slice):
+        rows = np.arange(*rows.indices(end))
+    rows = np.asarray(rows, dtype='int64')
+
+    i = np.searchsorted(records['start'], rows, side='right') - 1
+    return records['t0'][i] + (rows - records['start'][i]) * records['dt'][i]
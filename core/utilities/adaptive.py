@@ -0,0 +1,116 @@
+"""
+Adaptive refinement of one dimensional studies (gate voltage, magnetic field): a coarse grid is
+measured first, then points are added in the middle of the intervals where a summary metric of
+the IV (e.g. the zero bias conductance) changes the most, until the budget of IVs is used up.
+
+    >>> sampler = AdaptiveSampler(np.linspace(-1, 1, 11), budget=30)
+    >>> for x in sampler:
+    ...     measure(x)
+    ...     sampler.tell(x, metric(x))
+
+The score of an interval is its length in the plane of x and metric, both scaled to their
+ranges, so steep parts get refined first and flat parts still get some points.
+"""
+from logging import getLogger
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+G_0 = 7.748e-5 # Siemens
+
+def zero_bias_conductance(resistance, fraction: float = .05, min_points: int = 10):
+    """dI/dV at V=0 in G_0 from rows of the adwin resistance dataset ('V (V)', 'I (A)'), as the
+    slope of a line through the points with |V| below ``fraction`` of the largest |V|."""
+    V = np.asarray(resistance['V (V)'], dtype=float)
+    I = np.asarray(resistance['I (A)'], dtype=float)
+    finite = np.isfinite(V) & np.isfinite(I)
+    V, I = V[finite], I[finite]
+    if len(V) < min_points:
+        return np.nan
+    mask = np.abs(V) <= fraction * np.max(np.abs(V))
+    if np.count_nonzero(mask) < min_points or np.ptp(V[mask]) == 0:
+        return np.nan
+    slope, _ = np.polyfit(V[mask], I[mask], 1)
+    return slope / G_0
+
+class AdaptiveSampler:
+    """Setpoints of a coarse grid, then refinements until ``budget`` setpoints were given.
+
+    Parameters
+    ----------
+    coarse : array
+        measured first, in the given order
+    budget : int
+        total number of setpoints, coarse ones included, None for the coarse grid only
+    min_step : float
+        intervals shorter than this are not split, default 1/1000 of the range
+    batch : int
+        refinements chosen at once, visited in one direction, e.g. for a slow magnet
+    """
+    def __init__(self, coarse, budget: int = None, min_step: float = None, batch: int = 1):
+        self.coarse = [float(x) for x in coarse]
+        self.budget = len(self.coarse) if budget is None else max(int(budget), len(self.coarse))
+        if min_step is None:
+            min_step = np.ptp(self.coarse) / 1000 if len(self.coarse) > 1 else 0.
+        self.min_step = min_step
+        self.batch = max(int(batch), 1)
+        self.points = {}
+        self.given = 0
+
+    @property
+    def refining(self):
+        return self.budget > len(self.coarse)
+
+    def tell(self, x: float, y: float):
+        """metric ``y`` measured at ``x``"""
+        self.points[float(x)] = float(y)
+
+    def scores(self):
+        """(left, right, score) of all intervals between measured points which can be split"""
+        if len(self.points) < 2:
+            return []
+        x = np.array(sorted(self.points))
+        y = np.array([self.points[k] for k in x])
+        finite = np.isfinite(y)
+        x_range = np.ptp(x)
+        y_range = np.ptp(y[finite]) if np.count_nonzero(finite) > 1 else 0.
+        dx = np.diff(x) / x_range
+        dy = np.diff(y) / y_range if y_range > 0 else np.zeros(len(dx))
+        # no metric on one side, only the length counts
+        dy = np.where(np.isfinite(dy), dy, 0.)
+        score = np.hypot(dx, dy)
+        return [
+            (x[i], x[i+1], score[i])
+            for i in range(len(dx))
+            if x[i+1] - x[i] >= 2 * self.min_step
+        ]
+
+    def ask(self, n: int = 1):
+        """midpoints of the ``n`` intervals with the highest score, in one direction starting at
+        the end closer to the last point"""
+        intervals = sorted(self.scores(), key=lambda interval: -interval[2])[:n]
+        points = sorted((left + right) / 2 for left, right, _ in intervals)
+        if points and self.points:
+            last = list(self.points)[-1]
+            if abs(points[-1] - last) < abs(points[0] - last):
+                points = points[::-1]
+        return points
+
+    def __iter__(self):
+        for x in self.coarse:
+            if self.given >= self.budget:
+                return
+            self.given += 1
+            yield x
+        while self.given < self.budget:
+            points = self.ask(min(self.batch, self.budget - self.given))
+            if not points:
+                logger.info('nothing left to refine after %i points', self.given)
+                return
+            for x in points:
+                self.given += 1
+                yield x
+
+    def __len__(self):
+        return self.budget
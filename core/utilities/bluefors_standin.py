@@ -0,0 +1,153 @@
+"""
+Local stand-in for the /values/ endpoint of the BlueFors control software API, to run the
+BlueForsAPI driver and its polling without the fridge.
+
+GET /values/ returns all values, GET /values/driver/lakeshore/status/inputs only the values
+below driver.lakeshore.status.inputs. POST /values/ sets the posted values. With ``fail`` set, /values/ answers 503. Besides the keys of
+the driver, the stand-in serves ``filler`` other values, so the payload of the full endpoint is
+about as large as the real one.
+
+usage:
+    python -m core.utilities.bluefors_standin [port]
+"""
+import sys
+import json
+import time
+from threading import Thread, Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from logging import getLogger
+
+import numpy as np
+
+NAME = 'bluefors_standin'
+DEFAULT_PORT = 49099
+
+logger = getLogger(NAME)
+
+TEMPERATURES = {
+    'driver.lakeshore.status.inputs.channelA.temperature': 0.010,
+    'driver.lakeshore.status.inputs.channel1.temperature': 45.,
+    'driver.lakeshore.status.inputs.channel2.temperature': 3.5,
+    'driver.lakeshore.status.inputs.channel3.temperature': 3.6,
+    'driver.lakeshore.status.inputs.channel5.temperature': 0.8,
+    'driver.lakeshore.status.inputs.channel6.temperature': 0.009,
+    'driver.lakeshore.status.inputs.channel7.temperature': 0.012,
+    'driver.lakeshore.status.inputs.channel8.temperature': 0.011,
+}
+OTHERS = {
+    **{f'driver.maxigauge.pressures.p{i}': 1e-3 * i for i in range(1, 7)},
+    'driver.vc.flow': 0.5,
+    'driver.lakeshore.status.outputs.sample.measured': 0.,
+}
+
+class StandInValues:
+    """The values served, the temperatures wander by a relative ``noise`` per request."""
+    def __init__(self, filler: int = 600, noise: float = 1e-4):
+        self.lock = Lock()
+        self.noise = noise
+        self.values = {}
+        now = time.time()
+        for key, value in {**TEMPERATURES, **OTHERS}.items():
+            self.values[key] = self._entry(value, now)
+        for i in range(filler):
+            self.values[f'mapper.filler.value{i:04d}'] = self._entry(0., now)
+
+    def _entry(self, value, now):
+        return {'content': {'latest_value': {'date': int(now * 1000), 'value': str(value)}}}
+
+    def update(self):
+        now = time.time()
+        with self.lock:
+            for key in TEMPERATURES:
+                latest = self.values[key]['content']['latest_value']
+                value = float(latest['value']) * (1 + self.noise * np.random.randn())
+                self.values[key] = self._entry(value, now)
+
+    def get(self, prefix: str = ''):
+        self.update()
+        with self.lock:
+            return {k: v for k, v in self.values.items() if k.startswith(prefix)}
+
+    def post(self, data: dict):
+        now = time.time()
+        with self.lock:
+            for key, item in data.items():
+                content = item.get('content', {})
+                if 'value' in content:
+                    self.values[key] = self._entry(content['value'], now)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait for the delayed ack
+    disable_nagle_algorithm = True
+
+    def _send(self, code, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.strip('/').split('/')
+        if path[0] != 'values':
+            self._send(404, {'error': 'not found'})
+            return
+        if self.server.fail:
+            # the values keep changing during the outage
+            self.server.values.update()
+            self._send(503, {'error': 'unavailable'})
+            return
+        if len(path) > 1 and not self.server.subtrees:
+            self._send(404, {'error': 'subtree requests not supported'})
+            return
+        self.server.requests += 1
+        self._send(200, {'data': self.server.values.get('.'.join(path[1:]))})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.posts += 1
+        self.server.values.post(body.get('data', {}))
+        self._send(200, {'data': {}})
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+class BlueForsStandIn(ThreadingHTTPServer):
+    """The stand-in server, ``port=0`` picks a free port. ``subtrees=False`` behaves like an
+    API which only serves the full /values/ endpoint."""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, subtrees: bool = True, filler: int = 600):
+        super().__init__(('localhost', port), StandInHandler)
+        self.values = StandInValues(filler=filler)
+        self.subtrees = subtrees
+        self.fail = False
+        self.requests = 0
+        self.posts = 0
+        self._thread = None
+
+    @property
+    def address(self):
+        return f'localhost:{self.server_address[1]}'
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, name=NAME, daemon=True)
+        self._thread.start()
+        logger.info('%s serving on %s', NAME, self.address)
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = BlueForsStandIn(port)
+    print(f'{NAME} serving on {server.address}')
+    server.serve_forever()
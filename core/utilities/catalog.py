@@ -0,0 +1,93 @@
+"""
+Catalog of the IVs recorded by MeasurementScript_v2: one row per IV in the dataset 'catalog' of the
+data server file, with the swept parameters as numbers instead of packed into group names.
+
+    >>> catalog = load_catalog(dgw)                       # or a SegmentedFile
+    >>> rows = query(catalog, magnetic_field=10e-3, sort='gate_voltage')
+    >>> [name.decode() for name in rows['name']]
+
+Parameters are stored in SI units (V, T, Hz, W), NaN if they were not set.
+"""
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = 'catalog'
+NAME_LENGTH = 256
+
+# parameters set up by MeasurementScript_v2 before an IV
+PARAMETERS = [
+    'gate_voltage',
+    'magnetic_field',
+    'vna_frequency',
+    'vna_amplitude',
+    'motor_position',
+    'heater_power',
+    'sample_rate',
+    'femto1_amp',
+    'femto2_amp',
+]
+
+# settings of the IV itself, see measure_IV
+SETTINGS = [
+    'amplitude',
+    'period',
+    'offset_time',
+    'sweep_time',
+]
+
+catalog_dtype = np.dtype(
+    [('time', '<f8'), ('study', f'S{NAME_LENGTH}'), ('name', f'S{NAME_LENGTH}')]
+    + [(key, '<f8') for key in PARAMETERS + SETTINGS]
+)
+
+def parameters():
+    """All parameters unset, the state at the start of a study."""
+    return {key: np.nan for key in PARAMETERS}
+
+def catalog_row(name: str, study: str = '', **values):
+    """One row for the IV measured under measurement/<name>, missing values are NaN."""
+    unknown = set(values) - set(PARAMETERS + SETTINGS)
+    if unknown:
+        raise KeyError(f'unknown catalog fields {sorted(unknown)}')
+    row = np.zeros(1, dtype=catalog_dtype)
+    row['time'] = time.time()
+    row['study'] = study.encode()[:NAME_LENGTH]
+    row['name'] = name.encode()[:NAME_LENGTH]
+    for key in PARAMETERS + SETTINGS:
+        value = values.get(key, None)
+        row[key] = np.nan if value is None else float(value)
+    return row
+
+def load_catalog(source):
+    """The catalog from anything with ``get_data``, e.g. a DataGateway or a SegmentedFile."""
+    try:
+        return np.asarray(source.get_data(CATALOG_PATH))
+    except KeyError:
+        logger.warning('no catalog in the data file')
+        return np.zeros(0, dtype=catalog_dtype)
+
+def query(catalog, sort: str = None, rtol: float = 1e-6, **conditions):
+    """Rows matching all conditions, sorted by the field ``sort``.
+
+    A condition is a value (compared with ``rtol``), a (min, max) tuple, None for unset
+    parameters, or a string for ``study`` and ``name``.
+    """
+    mask = np.ones(len(catalog), dtype=bool)
+    for key, value in conditions.items():
+        column = catalog[key]
+        if isinstance(value, str):
+            mask &= column == value.encode()
+        elif isinstance(value, tuple):
+            mask &= (column >= value[0]) & (column <= value[1])
+        elif value is None:
+            mask &= np.isnan(column)
+        else:
+            mask &= np.isclose(column, value, rtol=rtol, atol=0)
+    rows = catalog[mask]
+    if sort is not None:
+        rows = rows[np.argsort(rows[sort], kind='stable')]
+    return rows
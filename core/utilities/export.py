@@ -0,0 +1,175 @@
+"""
+Export of a data server file into columnar shards for the evaluation, one process per group.
+
+Every group with datasets (e.g. measurement/<study>/<iv>/sweep with adwin, rref, ... or status)
+becomes a directory below the output directory, every dataset a series of shards of at most
+``shard_rows`` rows named <dataset>.<first row>.npz (or .parquet), one array per field. A
+manifest _export.json in each directory keeps the exported row counts, so running the export
+again only writes rows which were appended since and skips finished groups.
+
+A file the data server has open is exported up to the ``flushed`` length of every dataset
+(see hdf5safe.FlushCheckpointer). If the server flushed again during the export, the rows read
+may not belong to one flush, the manifests are not updated and the next export writes the same
+shards again.
+
+usage:
+    python -m core.utilities.export file.hdf5 out_dir [workers] [npz|parquet]
+"""
+import os
+import sys
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import h5py
+import numpy as np
+
+from core.utilities.hdf5safe import LiveFile, FLUSH_COUNT_ATTR, FLUSHED_ATTR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = '_export.json'
+SHARD_ROWS = 1_000_000
+FORMATS = ('npz', 'parquet')
+
+# file of a worker process, opened once for all its groups
+_file = None
+
+def open_file(filename: str):
+    """(LiveFile, h5py.File) of ``filename``, read only."""
+    live = LiveFile(filename)
+    return live, h5py.File(live, 'r', locking=False)
+
+def flush_count(filename: str):
+    """flush_count on disk, None for a file which is not open for writing."""
+    live, f = open_file(filename)
+    with live, f:
+        return f.attrs.get(FLUSH_COUNT_ATTR, 0) if live.live else None
+
+def groups(f):
+    """Paths of all groups which directly contain datasets."""
+    found = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Group) and any(isinstance(v, h5py.Dataset) for v in obj.values()):
+            found.append(name)
+
+    if any(isinstance(v, h5py.Dataset) for v in f.values()):
+        found.append('')
+    f.visititems(visit)
+    return found
+
+def columns(data):
+    """Dict of one array per field, plain datasets as 'value'."""
+    if data.dtype.names is None:
+        return {'value': data}
+    return {name: data[name] for name in data.dtype.names}
+
+def write_shard(path: str, data, fmt: str):
+    tmp = f'{path}.tmp'
+    if fmt == 'npz':
+        with open(tmp, 'wb') as f:
+            np.savez(f, **columns(data))
+    else:
+        import pandas as pd
+        table = {}
+        for name, column in columns(data).items():
+            # sub arrays, e.g. the binned sweeps, as one column per element
+            if column.ndim > 1:
+                for i, c in enumerate(column.reshape(len(column), -1).T):
+                    table[f'{name}_{i}'] = c
+            else:
+                table[name] = column
+        pd.DataFrame(table).to_parquet(tmp)
+    os.replace(tmp, path)
+
+def manifest_path(out_dir: str, group: str):
+    return os.path.join(out_dir, *group.split('/'), MANIFEST)
+
+def save_manifest(path: str, manifest: dict):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=4, default=str)
+    os.replace(tmp, path)
+
+def export_group(live, f, group: str, out_dir: str, fmt: str = 'npz', shard_rows: int = SHARD_ROWS):
+    """Write the rows of all datasets in ``group`` not exported yet, up to the flushed length
+    of a live file. Returns (group, updated manifest, rows), the manifest is not saved."""
+    path = manifest_path(out_dir, group)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {}
+
+    written = 0
+    node = f[group] if group else f
+    for name, dset in node.items():
+        if not isinstance(dset, h5py.Dataset) or dset.ndim == 0:
+            continue
+        entry = manifest.get(name, {'rows': 0, 'shards': []})
+        length = dset.shape[0]
+        if live.live:
+            # rows past the last flush may not be on disk yet
+            length = min(length, int(dset.attrs.get(FLUSHED_ATTR, 0)))
+        for start in range(entry['rows'], length, shard_rows):
+            stop = min(start + shard_rows, length)
+            shard = f'{name}.{start:012d}.{fmt}'
+            write_shard(os.path.join(os.path.dirname(path), shard), dset[start:stop], fmt)
+            entry['shards'].append(shard)
+            entry['rows'] = stop
+            written += stop - start
+        entry['attrs'] = {k: v.tolist() if hasattr(v, 'tolist') else v for k, v in dset.attrs.items()}
+        manifest[name] = entry
+    return group, manifest, written
+
+def _open_worker(filename: str):
+    global _file
+    _file = open_file(filename)
+
+def _export_task(group: str, out_dir: str, fmt: str, shard_rows: int):
+    live, f = _file
+    count = f.attrs.get(FLUSH_COUNT_ATTR, 0) if live.live else None
+    return export_group(live, f, group, out_dir, fmt, shard_rows) + (count,)
+
+def export(filename: str, out_dir: str, workers: int = None, fmt: str = 'npz', shard_rows: int = SHARD_ROWS):
+    """Export all groups of ``filename`` in a pool of ``workers`` processes."""
+    if fmt not in FORMATS:
+        raise ValueError(f'format "{fmt}" not in {FORMATS}')
+    tic = time.perf_counter()
+    live, f = open_file(filename)
+    with live, f:
+        todo = groups(f)
+        count = f.attrs.get(FLUSH_COUNT_ATTR, 0) if live.live else None
+    logger.info('exporting %i groups of "%s" to "%s"', len(todo), filename, out_dir)
+
+    total = 0
+    manifests = {}
+    counts = {count}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker, initargs=(filename,)) as pool:
+        futures = [pool.submit(_export_task, group, out_dir, fmt, shard_rows) for group in todo]
+        for future in as_completed(futures):
+            group, manifest, written, worker_count = future.result()
+            manifests[group] = manifest
+            counts.add(worker_count)
+            total += written
+            if written:
+                logger.info('"%s": %i rows', group, written)
+
+    counts.add(flush_count(filename))
+    if len(counts) > 1:
+        logger.warning('"%s" was flushed during the export, manifests not updated', filename)
+        return 0
+    for group, manifest in manifests.items():
+        save_manifest(manifest_path(out_dir, group), manifest)
+    logger.info('exported %i rows in %.1fs', total, time.perf_counter() - tic)
+    return total
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    filename, out_dir = sys.argv[1], sys.argv[2]
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    fmt = sys.argv[4] if len(sys.argv) > 4 else 'npz'
+    export(filename, out_dir, workers, fmt)
@@ -0,0 +1,301 @@
+"""
+Crash safety for the data server file: flush checkpoints while running and a recovery step
+before the server opens the file again, replacing the manual ``h5clear -s`` (Tools/README.md).
+"""
+import io
+import os
+import errno
+import time
+import shutil
+from threading import Thread, Event, Lock
+from logging import getLogger
+
+import h5py
+
+NAME = 'hdf5safe'
+
+logger = getLogger(NAME)
+
+SIGNATURE = b'\x89HDF\r\n\x1a\n'
+# superblock versions 2 and 3 keep the file consistency flags and a checksum
+FLAGS_OFFSET = 11
+CHECKPOINT_ATTR = 'checkpoint'
+# number of the last flush (root) and the length of a dataset at that flush, see LiveFile
+FLUSH_COUNT_ATTR = 'flush_count'
+FLUSHED_ATTR = 'flushed'
+
+def lookup3(data: bytes, initval: int = 0):
+    """Jenkins lookup3 hashlittle, the checksum of the HDF5 superblock."""
+    mask = 0xffffffff
+
+    def rot(x, k):
+        return ((x << k) | (x >> (32 - k))) & mask
+
+    length = len(data)
+    a = b = c = (0xdeadbeef + length + initval) & mask
+
+    def word(i):
+        return int.from_bytes(data[i:i + 4].ljust(4, b'\0'), 'little')
+
+    i = 0
+    while length - i > 12:
+        a = (a + word(i)) & mask
+        b = (b + word(i + 4)) & mask
+        c = (c + word(i + 8)) & mask
+        a = (a - c) & mask; a ^= rot(c, 4);  c = (c + b) & mask
+        b = (b - a) & mask; b ^= rot(a, 6);  a = (a + c) & mask
+        c = (c - b) & mask; c ^= rot(b, 8);  b = (b + a) & mask
+        a = (a - c) & mask; a ^= rot(c, 16); c = (c + b) & mask
+        b = (b - a) & mask; b ^= rot(a, 19); a = (a + c) & mask
+        c = (c - b) & mask; c ^= rot(b, 4);  b = (b + a) & mask
+        i += 12
+
+    if length - i == 0:
+        return c
+    a = (a + word(i)) & mask
+    b = (b + word(i + 4)) & mask if length - i > 4 else b
+    c = (c + word(i + 8)) & mask if length - i > 8 else c
+
+    c ^= b; c = (c - rot(b, 14)) & mask
+    a ^= c; a = (a - rot(c, 11)) & mask
+    b ^= a; b = (b - rot(a, 25)) & mask
+    c ^= b; c = (c - rot(b, 16)) & mask
+    a ^= c; a = (a - rot(c, 4)) & mask
+    b ^= a; b = (b - rot(a, 14)) & mask
+    c ^= b; c = (c - rot(b, 24)) & mask
+    return c
+
+def find_superblock(f):
+    """Offset of the superblock, at 0 or after a user block of 512, 1024, 2048, ... bytes."""
+    size = f.seek(0, os.SEEK_END)
+    offset = 0
+    while offset + len(SIGNATURE) <= size:
+        f.seek(offset)
+        if f.read(len(SIGNATURE)) == SIGNATURE:
+            return offset
+        offset = 512 if offset == 0 else 2 * offset
+    return None
+
+def clean_superblock(f):
+    """Offset and bytes of the superblock with cleared consistency flags and new checksum.
+    Returns None if there is nothing to clear."""
+    offset = find_superblock(f)
+    if offset is None:
+        logger.error('%s no HDF5 superblock in "%s".', NAME, f.name)
+        return None
+    f.seek(offset)
+    head = bytearray(f.read(12))
+    version, size_offsets = head[8], head[9]
+    if version not in (2, 3):
+        logger.warning('%s superblock version %i of "%s" has no flags to clear.', NAME, version, f.name)
+        return None
+    if head[FLAGS_OFFSET] == 0:
+        return None
+
+    # signature, version, sizes, flags, 4 addresses, checksum
+    length = 12 + 4 * size_offsets
+    f.seek(offset)
+    block = bytearray(f.read(length))
+    block[FLAGS_OFFSET] = 0
+    return offset, bytes(block) + lookup3(bytes(block)).to_bytes(4, 'little')
+
+def clear_status_flags(filename: str):
+    """Same as ``h5clear -s``: reset the file consistency flags a crashed writer left set.
+    Returns True if flags were cleared."""
+    with open(filename, 'r+b') as f:
+        superblock = clean_superblock(f)
+        if superblock is None:
+            return False
+        offset, block = superblock
+        f.seek(offset)
+        f.write(block)
+    logger.info('%s cleared consistency flags of "%s".', NAME, filename)
+    return True
+
+def check(filename: str):
+    """Open the file read only and visit all objects, returns the last checkpoint time."""
+    with h5py.File(filename, 'r') as f:
+        f.visit(lambda name: None)
+        return f.attrs.get(CHECKPOINT_ATTR, None)
+
+def in_use(error: OSError):
+    """True if ``error`` means another process has the file open: the HDF5 file lock
+    (errno 11 on Linux) or a sharing violation on Windows. Such a file is not corrupt."""
+    return (
+        isinstance(error, PermissionError)
+        or error.errno in (errno.EAGAIN, errno.EACCES)
+        or 'unable to lock file' in str(error)
+    )
+
+def recover(filename: str):
+    """Make a file left behind by a crashed data server usable again, call before the server
+    opens it. If the flags are the only problem they are cleared. A file that still cannot be
+    read is moved aside, so the server starts with a new file under the same name. A file
+    another process has open is not touched, the error is raised.
+
+    Returns 'ok', 'recovered', 'moved' or 'new'.
+    """
+    if filename is None or not os.path.exists(filename):
+        return 'new'
+
+    tic = time.perf_counter()
+    try:
+        check(filename)
+        return 'ok'
+    except OSError as e:
+        if in_use(e):
+            logger.error('%s "%s" is open in another process, not touched.', NAME, filename)
+            raise
+        logger.warning('%s "%s" cannot be opened: %s', NAME, filename, e)
+
+    try:
+        clear_status_flags(filename)
+        checkpoint = check(filename)
+    except OSError as e:
+        if in_use(e):
+            logger.error('%s "%s" is open in another process, not touched.', NAME, filename)
+            raise
+        root, ext = os.path.splitext(filename)
+        moved = f"{root} corrupt {time.strftime('%Y-%m-%d %H-%M-%S')}{ext}"
+        shutil.move(filename, moved)
+        logger.error('%s "%s" is not recoverable (%s), moved to "%s".', NAME, filename, e, moved)
+        return 'moved'
+
+    if checkpoint is None:
+        logger.info('%s recovered "%s" in %.2fs.', NAME, filename, time.perf_counter() - tic)
+    else:
+        logger.info(
+            '%s recovered "%s" in %.2fs, last checkpoint %s.',
+            NAME, filename, time.perf_counter() - tic, time.ctime(checkpoint))
+    return 'recovered'
+
+class LiveFile(io.RawIOBase):
+    """Read only view of a file the data server has open for writing.
+
+    The writer keeps the consistency flags set, so HDF5 refuses to open the file anywhere else
+    unless the writer is in SWMR mode, which p5control can not use since it creates datasets
+    while running. This view serves the superblock with cleared flags and the rest of the file
+    as it is on disk::
+
+        live = LiveFile(filename)
+        f = h5py.File(live, 'r', locking=False)
+
+    This is not a consistent snapshot: between flushes the writer's metadata cache writes B-tree
+    nodes and object headers whenever it likes, so reads may return wrong rows or fail inside
+    libhdf5. Only trust rows below the length FlushCheckpointer recorded in the ``flushed``
+    attribute of a dataset, and only if the ``flush_count`` on disk is the one the server
+    reports.
+    """
+    def __init__(self, filename: str):
+        super().__init__()
+        self.name = filename
+        self._f = open(filename, 'rb')
+        superblock = clean_superblock(self._f)
+        # flags set: a writer has the file open, or crashed
+        self.live = superblock is not None
+        self._patch = superblock if superblock is not None else (0, b'')
+        self._f.seek(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def readinto(self, b):
+        pos = self._f.tell()
+        n = self._f.readinto(b)
+        offset, block = self._patch
+        start, stop = max(pos, offset), min(pos + n, offset + len(block))
+        if start < stop:
+            b[start - pos:stop - pos] = block[start - offset:stop - offset]
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+class FlushCheckpointer(Thread):
+    """Flushes the file of a running InstrumentServer every ``interval`` seconds, so a crash
+    loses at most one interval. The time of the last flush is kept in the root attribute
+    ``checkpoint`` and its number in ``flush_count``, for readers of the live file
+    (core.plot.LocalDataGateway, core.utilities.export).
+
+    The appends of the data server are wrapped to note the length of every dataset after its
+    last completed append. At a flush these lengths are written to the ``flushed`` attribute of
+    the datasets appended since the last flush, no other dataset is visited and appends go on
+    while the file is flushed."""
+    def __init__(self, inserv, interval: float = 10.):
+        super().__init__(name='FlushCheckpointer', daemon=True)
+        self.inserv = inserv
+        self.interval = interval
+        self.stop_event = Event()
+        self.checkpoint = None
+
+        self.lock = Lock()
+        # path -> length after the last completed append, since the last flush
+        self.lengths = {}
+        # path -> number of appends in progress
+        self.pending = {}
+        self._tracked = None
+
+    def run(self):
+        logger.info('%s.run() every %.1fs', NAME, self.interval)
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def track(self, data_server):
+        """Wrap ``data_server.append``, appends of rpyc clients go through it as well."""
+        if data_server is self._tracked:
+            return
+        append = data_server.append
+
+        def tracked_append(path, arr, **kwargs):
+            with self.lock:
+                self.pending[path] = self.pending.get(path, 0) + 1
+            try:
+                return append(path, arr, **kwargs)
+            finally:
+                with self.lock:
+                    self.pending[path] -= 1
+                    # another append may have resized the dataset without writing yet
+                    if self.pending[path] == 0:
+                        del self.pending[path]
+                        try:
+                            self.lengths[path] = data_server.get(path).shape[0]
+                        except KeyError:
+                            pass
+
+        data_server.append = tracked_append
+        self._tracked = data_server
+
+    def flush(self):
+        data_server = getattr(self.inserv, '_data_server', None)
+        if data_server is None:
+            return
+        self.track(data_server)
+        with self.lock:
+            lengths, self.lengths = self.lengths, {}
+
+        root = data_server.get('/')
+        for path, length in lengths.items():
+            try:
+                dset = root[path]
+            except KeyError:
+                # the file rolled over since the append
+                continue
+            dset.attrs[FLUSHED_ATTR] = min(length, dset.shape[0])
+        root.attrs[CHECKPOINT_ATTR] = time.time()
+        root.attrs[FLUSH_COUNT_ATTR] = int(root.attrs.get(FLUSH_COUNT_ATTR, 0)) + 1
+        root.file.flush()
+        self.checkpoint = time.time()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
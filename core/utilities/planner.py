@@ -0,0 +1,158 @@
+"""
+Order of the setpoints of a study, so slow actuators (magnet ramps, heater settling) travel as
+little as possible, with an estimate of the duration of the study.
+
+The grid is a dict of parameter name -> values, the points are all combinations. Each parameter
+has a cost model cost(a, b) -> seconds to go from value a to b.
+
+    >>> costs = {'magnetic_field': ramp_cost(0.01/60, settle=10), 'vna_frequency': constant_cost(1)}
+    >>> points, seconds = plan({'magnetic_field': fields, 'vna_frequency': freqs}, costs, order='serpentine')
+
+orders:
+    given       combinations in the order of the grid, like itertools.product
+    serpentine  most expensive parameter outermost, the inner ones alternate their direction
+    nearest     greedy nearest neighbour, always the cheapest next point
+    monotonic   the parameter ``monotonic`` (e.g. a hysteretic one) is outermost and only moves
+                in one direction, the rest serpentine
+
+A parameter with repeated values (e.g. a hysteresis loop 0, 1, 0) keeps all of them in the given
+order in every order, it is never sorted or reversed.
+"""
+import itertools
+from logging import getLogger
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+ORDERS = ('given', 'serpentine', 'nearest', 'monotonic')
+
+"""
+cost models
+"""
+def ramp_cost(rate: float, settle: float = 0.):
+    """ramp at ``rate`` (units per s) and wait ``settle`` s"""
+    def cost(a, b):
+        if a == b:
+            return 0.
+        return abs(b - a) / rate + settle
+    return cost
+
+def step_cost(up: float, down: float = None):
+    """``up`` s to settle after an increase, ``down`` s after a decrease, e.g. heating and cooling"""
+    if down is None:
+        down = up
+    def cost(a, b):
+        if a == b:
+            return 0.
+        return up if b > a else down
+    return cost
+
+def constant_cost(settle: float = 0.):
+    """``settle`` s for every change"""
+    return step_cost(settle, settle)
+
+def transition(a: dict, b: dict, costs: dict):
+    """seconds from point a to b, the parameters are set one after the other"""
+    if a is None:
+        return 0.
+    total = 0.
+    for key, value in b.items():
+        if key in costs and a.get(key, None) is not None:
+            total += costs[key](a[key], value)
+    return total
+
+def duration(points, costs: dict, start: dict = None, measure_time: float = 0.):
+    """seconds for the study: all transitions starting from ``start`` and ``measure_time`` per point"""
+    total = len(points) * measure_time
+    previous = start
+    for point in points:
+        total += transition(previous, point, costs)
+        previous = point
+    return total
+
+"""
+orders
+"""
+def _traverse_cost(values, cost):
+    return sum(cost(a, b) for a, b in zip(values[:-1], values[1:]))
+
+def _axis(key, values):
+    """sorted values, or the given ones if a value repeats"""
+    values = np.asarray(values, dtype=float)
+    unique = np.unique(values)
+    if len(unique) < len(values):
+        logger.warning('%s has repeated values, kept in the given order', key)
+        return values.tolist(), True
+    return unique.tolist(), False
+
+def _serpentine(axes, start):
+    """points of ``axes`` [(key, sorted values, fixed), ...], the first outermost, starting at
+    the end closer to ``start``. ``fixed`` axes are always traversed as given."""
+    points = [{}]
+    for key, values, fixed in axes:
+        values = list(values)
+        if not fixed and start is not None and start.get(key, None) is not None:
+            if abs(values[-1] - start[key]) < abs(values[0] - start[key]):
+                values = values[::-1]
+        extended = []
+        for i, point in enumerate(points):
+            row = values if i % 2 == 0 or fixed else values[::-1]
+            extended += [{**point, key: value} for value in row]
+        points = extended
+    return points
+
+def _nearest(points, costs, start):
+    todo = list(points)
+    ordered = []
+    previous = start if start is not None else todo[0]
+    while todo:
+        i = int(np.argmin([transition(previous, point, costs) for point in todo]))
+        previous = todo.pop(i)
+        ordered.append(previous)
+    return ordered
+
+def plan(
+        grid: dict,
+        costs: dict,
+        order: str = 'given',
+        start: dict = None,
+        measure_time: float = 0.,
+        monotonic: str = None,
+    ):
+    """Points of ``grid`` in the given ``order``, returns (points, estimated seconds).
+
+    ``start`` is the point the actuators are at before the study, parameters without a cost
+    model are free.
+    """
+    if order not in ORDERS:
+        raise ValueError(f'order "{order}" not in {ORDERS}')
+    keys = list(grid)
+    if order == 'given':
+        points = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    else:
+        free = lambda a, b: 0.
+        axes = [(key, *_axis(key, grid[key])) for key in keys]
+        # expensive parameters outermost
+        axes.sort(key=lambda axis: -_traverse_cost(axis[1], costs.get(axis[0], free)))
+        if order == 'monotonic':
+            axes.sort(key=lambda axis: axis[0] != monotonic)
+        points = _serpentine(axes, start)
+        if order == 'nearest':
+            if any(fixed for _, _, fixed in axes):
+                # the nearest point would be the repeated one
+                logger.warning('nearest order with repeated values, serpentine instead')
+            else:
+                points = _nearest(points, costs, start)
+        points = [{key: point[key] for key in keys} for point in points]
+
+    seconds = duration(points, costs, start, measure_time)
+    logger.info('%i points in %s order, estimated %.1f h', len(points), order, seconds / 3600)
+    return points, seconds
+
+def compare(grid: dict, costs: dict, start: dict = None, measure_time: float = 0., monotonic: str = None):
+    """estimated seconds of every order"""
+    return {
+        order: plan(grid, costs, order, start, measure_time, monotonic)[1]
+        for order in ORDERS
+    }
@@ -0,0 +1,261 @@
+"""
+Rollover of the data server file into segments by size or time, with a small json index next to
+the first file and a reader which presents the segments as one file.
+
+Segments of 'OI-25d-10 2025-06-17 breaking 0.hdf5' are named
+'OI-25d-10 2025-06-17 breaking 0 part 001.hdf5', ... and listed in
+'OI-25d-10 2025-06-17 breaking 0.index.json' with their time range and the measurements in them.
+"""
+import os
+import time
+import json
+from threading import Thread, Event
+from logging import getLogger
+
+import h5py
+import numpy as np
+
+from core.utilities.hdf5safe import LiveFile
+
+NAME = 'segments'
+
+logger = getLogger(NAME)
+
+MEASUREMENT_PATH = 'measurement'
+
+class SegmentIndex:
+    """The json index of the segments of a data server file.
+
+    Parameters
+    ----------
+    filename : str
+        the first file, as given to the InstrumentServer
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        root, self.ext = os.path.splitext(filename)
+        self.root = os.path.basename(root)
+        self.index_filename = f'{root}.index.json'
+        self.segments = []
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_filename, 'r') as f:
+                self.segments = json.load(f)['segments']
+        except FileNotFoundError:
+            self.segments = []
+        if not self.segments:
+            self.segments = [self._entry(os.path.basename(self.filename))]
+
+    def save(self):
+        # write a copy and replace, a crash never leaves half an index
+        tmp = f'{self.index_filename}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'base': os.path.basename(self.filename), 'segments': self.segments}, f, indent=4)
+        os.replace(tmp, self.index_filename)
+
+    def _entry(self, file):
+        return {'file': file, 'start': time.time(), 'stop': None, 'measurements': []}
+
+    def path(self, segment: dict):
+        return os.path.join(self.directory, segment['file'])
+
+    def current(self):
+        """The file the data server should write to, the last segment."""
+        return self.path(self.segments[-1])
+
+    def next_filename(self):
+        return os.path.join(self.directory, f'{self.root} part {len(self.segments):03d}{self.ext}')
+
+    def add(self, filename: str):
+        self.segments[-1]['stop'] = time.time()
+        self.segments.append(self._entry(os.path.basename(filename)))
+        self.save()
+
+    def select(self, measurement: str = None, start: float = None, stop: float = None):
+        """Segments which contain ``measurement`` and overlap the time range."""
+        selected = []
+        for segment in self.segments:
+            if measurement is not None and measurement not in segment['measurements']:
+                continue
+            seg_stop = segment['stop'] if segment['stop'] is not None else time.time()
+            if start is not None and seg_stop < start:
+                continue
+            if stop is not None and segment['start'] > stop:
+                continue
+            selected.append(segment)
+        return selected
+
+class Rollover(Thread):
+    """Switches the file of a running InstrumentServer to a new segment once it is larger than
+    ``max_size`` bytes or older than ``interval`` seconds, checked every ``check`` seconds.
+
+    The switch happens under the lock of the hdf5 handler, appends after it create their datasets
+    in the new file. Measurements running during a switch continue in the new segment, the
+    reader joins them again. The old file is closed one check later, so appends which still
+    set attributes on it are not cut off. Viewers show the new segment after reconnecting.
+    """
+    def __init__(
+        self,
+        inserv,
+        index: SegmentIndex,
+        max_size: float = 2e9,
+        interval: float = 24 * 3600.,
+        check: float = 10.,
+    ):
+        super().__init__(name='Rollover', daemon=True)
+        self.inserv = inserv
+        self.index = index
+        self.max_size = max_size
+        self.interval = interval
+        self.check = check
+        self.stop_event = Event()
+        self._retired = None
+
+    def run(self):
+        logger.info('%s.run() max_size %.2e B, interval %.0fs', NAME, self.max_size, self.interval)
+        # the server continues in the last segment
+        self.index.segments[-1]['stop'] = None
+        self.index.save()
+        while not self.stop_event.wait(self.check):
+            self.tick()
+
+    def tick(self):
+        if self._retired is not None:
+            self._retired.close()
+            self._retired = None
+
+        data_server = getattr(self.inserv, '_data_server', None)
+        if data_server is None:
+            return
+        handler = data_server._handler
+        segment = self.index.segments[-1]
+        with handler._lock:
+            f = handler._f
+            if not f:
+                return
+            self._update_measurements(f, segment)
+
+            size = os.path.getsize(handler._filename)
+            age = time.time() - segment['start']
+            if size < self.max_size and age < self.interval:
+                return
+
+            filename = self.index.next_filename()
+            f.flush()
+            handler._f = h5py.File(filename, 'a', libver='latest')
+            handler._filename = filename
+            data_server._filename = filename
+            self._retired = f
+        self.index.add(filename)
+        logger.info('%s rolled over to "%s" after %.2e B, %.0fs', NAME, filename, size, age)
+
+    def _update_measurements(self, f, segment):
+        if MEASUREMENT_PATH not in f:
+            return
+        names = list(f[MEASUREMENT_PATH].keys())
+        if names != segment['measurements']:
+            segment['measurements'] = names
+            self.index.save()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        if self._retired is not None:
+            self._retired.close()
+            self._retired = None
+        self.index.segments[-1]['stop'] = time.time()
+        self.index.save()
+
+class SegmentedFile:
+    """Read only view of all segments of a data server file, as if it was one file.
+
+    ``get_data`` has the signature of the DataGateway, datasets which are split over segments
+    are joined along the first axis. Segments are opened through LiveFile, so the segment the
+    server is writing to can be read as well::
+
+        with SegmentedFile('OI-25d-10 2025-06-17 breaking 0.hdf5') as sf:
+            sf.measurements()
+            data = sf.get_data('measurement/iv_0/adwin', slice(-1000, None))
+
+    Parameters
+    ----------
+    filename : str
+        the first file, as given to the InstrumentServer
+    """
+    def __init__(self, filename: str):
+        self.index = SegmentIndex(filename)
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for live, f in self._files.values():
+            f.close()
+            live.close()
+        self._files = {}
+
+    def _open(self, segment):
+        if segment['file'] not in self._files:
+            live = LiveFile(self.index.path(segment))
+            self._files[segment['file']] = (live, h5py.File(live, 'r', locking=False))
+        return self._files[segment['file']][1]
+
+    def measurements(self, start: float = None, stop: float = None):
+        names = []
+        for segment in self.index.select(start=start, stop=stop):
+            names += [name for name in segment['measurements'] if name not in names]
+        return names
+
+    def files(self, measurement: str = None, start: float = None, stop: float = None):
+        return [self.index.path(segment) for segment in self.index.select(measurement, start, stop)]
+
+    def datasets(self, path: str):
+        """The parts of the dataset at ``path`` in order of the segments."""
+        segments = self.index.segments
+        if path.strip('/').startswith(f'{MEASUREMENT_PATH}/'):
+            measurement = path.strip('/').split('/')[1]
+            segments = self.index.select(measurement)
+        parts = []
+        for segment in segments:
+            f = self._open(segment)
+            if path in f:
+                parts.append(f[path])
+        if not parts:
+            raise KeyError(f'no segment contains "{path}"')
+        return parts
+
+    def length(self, path: str):
+        return sum(dset.shape[0] for dset in self.datasets(path))
+
+    def get_data(self, path: str, indices: slice = (), field: str = None):
+        """Like DataGateway.get_data, only slices with positive step are supported."""
+        parts = self.datasets(path)
+        if indices == ():
+            indices = slice(None)
+        if not isinstance(indices, slice):
+            raise TypeError('SegmentedFile.get_data only supports slices')
+        start, stop, step = indices.indices(sum(dset.shape[0] for dset in parts))
+        if step < 0:
+            raise ValueError('SegmentedFile.get_data only supports a positive step')
+
+        data = []
+        offset = 0
+        for dset in parts:
+            n = dset.shape[0]
+            if start < offset + n and stop > offset:
+                source = dset.fields(field) if field else dset
+                data.append(source[start - offset:min(stop, offset + n) - offset:step])
+                # continue the step pattern in the next segment
+                start += len(data[-1]) * step
+            offset += n
+        if not data:
+            source = parts[0].fields(field) if field else parts[0]
+            return source[0:0]
+        return np.concatenate(data)
@@ -0,0 +1,236 @@
+"""
+Stability check of the sample temperature, to wait after a heater change only as long as needed.
+
+The detector is fed with the (time, Tsample) samples of BlueForsAPI.get_data and calls the
+temperature stable once the samples of the last ``window`` seconds have a linear drift over the
+window and a noise (rms around the linear fit) below the relative tolerances ``drift`` and
+``noise``.
+
+    >>> detector = StabilityDetector(window=60, drift=1e-3, noise=2e-3)
+    >>> stable, settle_time = wait_until_stable(gw.bluefors.get_data, detector, timeout=3600)
+
+Instead of waiting for the tail to flatten out, EquilibriumEstimator fits an exponential approach
+to the samples since the heater step and is done once the predicted remaining drift is below the
+tolerance. Every fit is checked against the samples arriving next, these residuals are kept in
+``records`` (residual_dtype) for later review, MeasurementScript_v2 appends them to the dataset
+RESIDUALS_PATH.
+"""
+import time
+from logging import getLogger
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+# dataset of the prediction residuals in the data server file
+RESIDUALS_PATH = 'settle_residuals'
+
+residual_dtype = np.dtype([
+    ('start', '<f8'),       # time of the heater step
+    ('time', '<f8'),
+    ('T', '<f8'),           # measured
+    ('predicted', '<f8'),   # by the fit before this sample arrived
+    ('T_inf', '<f8'),
+    ('tau', '<f8'),
+    ('remaining', '<f8'),   # predicted time left in s
+])
+
+def fit_exponential(t, T, taus=60):
+    """Least squares fit of T = T_inf + A*exp(-t/tau), returns (T_inf, A, tau, rms).
+
+    For a fixed tau the fit is linear, tau is searched on a log grid over the span of t and
+    refined by golden section around the best grid point.
+    """
+    span = t[-1] - t[0]
+
+    def solve(tau):
+        M = np.stack((np.ones_like(t), np.exp(-(t - t[0]) / tau)), axis=1)
+        coef, *_ = np.linalg.lstsq(M, T, rcond=None)
+        rms = np.sqrt(np.mean((M @ coef - T)**2))
+        return coef, rms
+
+    grid = np.logspace(np.log10(span / 100), np.log10(span * 10), taus)
+    errors = [solve(tau)[1] for tau in grid]
+    i = int(np.argmin(errors))
+    lo, hi = np.log(grid[max(i-1, 0)]), np.log(grid[min(i+1, taus-1)])
+    golden = (np.sqrt(5) - 1) / 2
+    for _ in range(30):
+        a, b = hi - golden * (hi - lo), lo + golden * (hi - lo)
+        if solve(np.exp(a))[1] < solve(np.exp(b))[1]:
+            hi = b
+        else:
+            lo = a
+    tau = np.exp((lo + hi) / 2)
+    (T_inf, A), rms = solve(tau)
+    # amplitude at t = 0 instead of the first sample
+    return T_inf, A * np.exp(t[0] / tau), tau, rms
+
+class StabilityDetector:
+    """Relative drift and noise of the samples in the last ``window`` seconds.
+
+    Parameters
+    ----------
+    window : float
+        length of the window in s, the detector needs one full window of samples
+    drift : float
+        maximum change of the linear fit over the window, relative to the mean
+    noise : float
+        maximum rms around the linear fit, relative to the mean
+    min_samples : int
+        minimum number of samples in the window
+    """
+    def __init__(self, window: float = 60., drift: float = 1e-3, noise: float = 2e-3, min_samples: int = 5):
+        self.window = window
+        self.drift = drift
+        self.noise = noise
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self, start: float = None):
+        """forget all samples, samples before ``start`` are ignored from now on"""
+        self.start = -np.inf if start is None else start
+        self.t = np.zeros(0)
+        self.T = np.zeros(0)
+        self.last_drift = np.nan
+        self.last_noise = np.nan
+
+    def add(self, t, T):
+        """add samples, returns whether the temperature is stable now"""
+        t, T = np.asarray(t, dtype=float), np.asarray(T, dtype=float)
+        keep = (t >= self.start) & np.isfinite(T)
+        self.t = np.concatenate((self.t, t[keep]))
+        self.T = np.concatenate((self.T, T[keep]))
+        if len(self.t):
+            # keep a bit more than the window, to know when a full window was seen
+            recent = self.t >= self.t[-1] - 2 * self.window
+            self.t, self.T = self.t[recent], self.T[recent]
+        return self.stable()
+
+    def stable(self):
+        if len(self.t) == 0 or self.t[-1] - self.t[0] < self.window:
+            return False
+        mask = self.t >= self.t[-1] - self.window
+        t, T = self.t[mask], self.T[mask]
+        if len(t) < self.min_samples:
+            return False
+
+        mean = np.mean(T)
+        slope, offset = np.polyfit(t - t[0], T, 1)
+        residuals = T - (slope * (t - t[0]) + offset)
+        self.last_drift = abs(slope) * self.window / mean
+        self.last_noise = np.sqrt(np.mean(residuals**2)) / mean
+        return self.last_drift <= self.drift and self.last_noise <= self.noise
+
+def wait_until_stable(read, detector: StabilityDetector, timeout: float = 3600., min_time: float = 0., poll: float = 1., start: float = None):
+    """Feed ``detector`` from ``read()`` until the temperature is stable, at least ``min_time``
+    and at most ``timeout`` seconds after ``start`` (default now).
+
+    ``read`` returns {"time": [...], "Tsample": [...]} or None, like BlueForsAPI.get_data.
+    Returns (stable, settle time in s).
+    """
+    if start is None:
+        start = time.time()
+    detector.reset(start)
+    stable = False
+    while True:
+        data = read()
+        if data is not None:
+            stable = detector.add(data['time'], data['Tsample'])
+        elapsed = time.time() - start
+        if stable and elapsed >= min_time:
+            logger.info('temperature stable after %.1fs (drift %.1e, noise %.1e)', elapsed, detector.last_drift, detector.last_noise)
+            return True, elapsed
+        if elapsed >= timeout:
+            logger.warning('temperature not stable after %.1fs (drift %.1e, noise %.1e)', elapsed, detector.last_drift, detector.last_noise)
+            return False, elapsed
+        time.sleep(poll)
+
+class EquilibriumEstimator:
+    """Predicted equilibrium of an exponential approach after a heater step.
+
+    Works with wait_until_stable like StabilityDetector: ``last_drift`` is the predicted drift
+    within the next ``horizon`` seconds relative to the equilibrium, ``last_noise`` the relative
+    rms of the fit.
+
+    Parameters
+    ----------
+    tolerance : float
+        done once the predicted drift is below
+    horizon : float
+        time in s the temperature has to stay within tolerance, e.g. the duration of the IV,
+        inf for the distance to the equilibrium
+    noise : float
+        maximum relative rms of the fit, above the exponential does not describe the data
+    coverage : float
+        minimum time since the step in units of tau before a prediction is trusted
+    min_samples : int
+        minimum number of samples since the step
+    """
+    def __init__(self, tolerance: float = 1e-3, horizon: float = np.inf, noise: float = 2e-3, coverage: float = 1., min_samples: int = 10):
+        self.tolerance = tolerance
+        self.horizon = horizon
+        self.noise = noise
+        self.coverage = coverage
+        self.min_samples = min_samples
+        self.records = []
+        self.reset()
+
+    def reset(self, start: float = None):
+        """new heater step at ``start``, the records of earlier steps are kept"""
+        self.start = -np.inf if start is None else start
+        self.t = np.zeros(0)
+        self.T = np.zeros(0)
+        self.fit = None
+        self.remaining = np.nan
+        self.last_drift = np.nan
+        self.last_noise = np.nan
+
+    def predict(self, t):
+        """temperature at t from the latest fit"""
+        if self.fit is None:
+            return np.full(np.shape(t), np.nan)
+        T_inf, A, tau, _ = self.fit
+        return T_inf + A * np.exp(-(np.asarray(t) - self.t[0]) / tau)
+
+    def add(self, t, T):
+        """add samples and refit, returns whether the predicted drift is below tolerance"""
+        t, T = np.asarray(t, dtype=float), np.asarray(T, dtype=float)
+        keep = (t >= self.start) & np.isfinite(T)
+        t, T = t[keep], T[keep]
+        if len(t) == 0:
+            return self._done()
+
+        # residuals of the previous prediction
+        if self.fit is not None:
+            T_inf, _, tau, _ = self.fit
+            for ti, Ti, pi in zip(t, T, self.predict(t)):
+                self.records.append((self.t[0], ti, Ti, pi, T_inf, tau, self.remaining))
+
+        self.t = np.concatenate((self.t, t))
+        self.T = np.concatenate((self.T, T))
+        if len(self.t) < self.min_samples or self.t[-1] <= self.t[0]:
+            return False
+
+        T_inf, A, tau, rms = fit_exponential(self.t - self.t[0], self.T)
+        self.fit = (T_inf, A, tau, rms)
+        elapsed = self.t[-1] - self.t[0]
+        self.last_drift = abs(A * np.exp(-elapsed / tau) * -np.expm1(-self.horizon / tau) / T_inf)
+        self.last_noise = rms / abs(T_inf)
+        # time until the drift within the horizon is tolerance * T_inf
+        self.remaining = max(tau * np.log(max(self.last_drift, 1e-300) / self.tolerance), 0.)
+        return self._done()
+
+    def _done(self):
+        if self.fit is None:
+            return False
+        tau = self.fit[2]
+        elapsed = self.t[-1] - self.t[0]
+        return (
+            elapsed >= self.coverage * tau
+            and self.last_noise <= self.noise
+            and self.last_drift <= self.tolerance
+        )
+
+    def residuals(self):
+        """the records as array of residual_dtype, residual = T - predicted"""
+        return np.array(self.records, dtype=residual_dtype)
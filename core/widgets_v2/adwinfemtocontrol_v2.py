@@ -221,6 +221,10 @@ class AdwinFemtoControl(QWidget):
 
         self.status_indicator_A.setChecked(not arr['V1_ovl'])
         self.status_indicator_B.setChecked(not arr['V2_ovl'])
+        # overload counts of the last chunk, from the adwin chunk statistics
+        if 'V1_ovls' in arr.dtype.names:
+            self.status_indicator_A.setToolTip(f"{int(arr['V1_ovls'][0])} samples overloaded")
+            self.status_indicator_B.setToolTip(f"{int(arr['V2_ovls'][0])} samples overloaded")
 
         self.output_status_indicator.setChecked(arr['output'][0])
         self.sweeping_status_indicator.setChecked(arr['sweeping'][0])
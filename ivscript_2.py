@@ -3,18 +3,26 @@ from p5control.server.inserv import InstrumentServerError
 
 from time import sleep, time
 import numpy as np
+from rpyc.utils.classic import obtain
 from tqdm import tqdm
-from tqdm.contrib.itertools import product
 
 from core.drivers_v2.adwingold2_v6 import ADwinGold2
 from core.drivers_v2.femto_v2 import Femto
 from core.drivers_v2.rref import Rref
 from core.drivers_v2.blueforsapi_v2 import BlueForsAPI
-from core.drivers_v2.ami430_v2 import AMI430
+from core.drivers_v2.ami430_v2 import AMI430, wait_until_holding
 from core.drivers_v2.vna_v2 import ZNB40_source
 from core.drivers_v2.yoko_v2 import YokogawaGS200
 from core.drivers_v2.faulhaber_v2 import Faulhaber
 from core.drivers_v2.dummy_v2 import Dummy
+from core.utilities.segments import SegmentIndex, Rollover
+from core.utilities.catalog import CATALOG_PATH, catalog_row, parameters
+from core.utilities.settle import StabilityDetector, EquilibriumEstimator, wait_until_stable, RESIDUALS_PATH
+from core.utilities.planner import plan, ramp_cost, step_cost, constant_cost
+from core.utilities.adaptive import AdaptiveSampler, zero_bias_conductance
+
+# sample temperature saved by the status thread of the bluefors driver
+T_SAMPLE_PATH = "/status/bluefors/temperature/A-sample"
 
 # import logging
 # logger = logging.getLogger(__name__)
@@ -37,9 +45,16 @@ class BlueforsServer_v2():
             server_name = None,
             S = '11',
             R_ref= 5.2e4,
+            max_size = None,
+            interval = None,
             ):
         
-        
+        # rollover to a new segment file after max_size bytes or interval seconds
+        self.rollover = None
+        if server_name is not None and (max_size is not None or interval is not None):
+            segment_index = SegmentIndex(server_name)
+            server_name = segment_index.current()
+
         if server_name is None:
             self.inserv = InstrumentServer()
             # logging.basicConfig('
@@ -85,7 +100,18 @@ class BlueforsServer_v2():
             
         self.inserv.start()  
 
+        if server_name is not None and (max_size is not None or interval is not None):
+            self.rollover = Rollover(
+                self.inserv,
+                segment_index,
+                max_size=max_size if max_size is not None else np.inf,
+                interval=interval if interval is not None else np.inf,
+            )
+            self.rollover.start()
+
     def stop_server(self):        
+        if self.rollover is not None:
+            self.rollover.stop()
         self.inserv.stop()
         self.inserv._remove('femto')
         self.inserv._remove('bluefors')
@@ -126,9 +152,33 @@ class MeasurementScript_v2():
         self.femto2_amp = 1
         self.magnet_rate = 0.01 # T/min
 
+        # the magnet is waited for until it holds, then these settle times
         self.initial_ramp_cool_down = 600 # seconds
         self.ramp_cool_down = 10.0 # seconds
-        self.heater_cool_down = 10.0 # seconds
+        self.ramp_timeout = 7200.0 # seconds
+        self.ramp_times = []
+
+        # estimates for ordering the setpoints of a study, see core.utilities.planner
+        self.heater_up_time = 600.0 # seconds to settle after heating up
+        self.heater_down_time = 1800.0 # seconds to settle after cooling down
+        self.vna_change_time = 1.0 # seconds
+
+        # adaptive gate and field studies (budget), see core.utilities.adaptive
+        self.adaptive_batch = 1 # refinements chosen at once
+        self.gate_resolution = 1e-7 # V, resolution of the names
+        self.field_resolution = 1e-5 # T, resolution of the names
+        self.heater_cool_down = 10.0 # seconds, minimum wait after a heater change
+
+        # wait for a stable sample temperature after a heater change, see core.utilities.settle
+        self.heater_settle = False
+        self.heater_settle_window = 60.0 # seconds
+        self.heater_settle_drift = 1e-3 # relative change over the window
+        self.heater_settle_noise = 2e-3 # relative rms over the window
+        self.heater_settle_timeout = 3600.0 # seconds
+        # predict the equilibrium from an exponential fit, start once the drift predicted
+        # during the IV (offset_time + sweep_time) is below heater_settle_drift
+        self.heater_settle_predict = False
+        self.settle_times = []
         self.offset_cool_down = 0.0 # seconds
         self.sweep_cool_down = 0.0 # seconds
         self.meas_delay_time = .5
@@ -143,6 +193,10 @@ class MeasurementScript_v2():
         self.save_amp = .5 # V
         self.motor_speed = 20 # arb. units
 
+        # swept parameters of the running study, written to the catalog with every IV
+        self.study = ''
+        self.parameters = parameters()
+
         self.initialize_devices()
     
     def initialize_devices(self):    
@@ -170,6 +224,39 @@ class MeasurementScript_v2():
         self.gw.adwin.setSweeping(False)
         self.gw.adwin.setOutput(False)
 
+    def begin_study(self, name):
+        self.study = name
+        self.parameters = parameters()
+        # no study moves the motor, its position holds for all IVs (nan for the Dummy)
+        self.parameters['motor_position'] = self.gw.motor.get_status().get('position', None)
+
+    def transition_costs(self):
+        return {
+            'magnetic_field': ramp_cost(self.magnet_rate / 60, self.ramp_cool_down),
+            'heater_power': step_cost(self.heater_up_time, self.heater_down_time),
+            'vna_frequency': constant_cost(self.vna_change_time),
+            'vna_amplitude': constant_cost(self.vna_change_time),
+        }
+
+    def plan_study(self, grid, order, start=None, offset_time=None, sweep_time=None, monotonic=None):
+        if order is None:
+            order = 'given'
+        if offset_time is None:
+            offset_time = self.offset_time
+        if sweep_time is None:
+            sweep_time = self.sweep_time
+        measure_time = offset_time + sweep_time + 2 * self.meas_delay_time + self.offset_cool_down + self.sweep_cool_down
+        points, seconds = plan(grid, self.transition_costs(), order, start, measure_time, monotonic)
+        print(f'{self.study}: {len(points)} IVs in {order} order, estimated {seconds/3600:.2f} h')
+        return points
+
+    def zero_bias_conductance(self, name):
+        try:
+            resistance = obtain(self.dgw.get_data(f"/measurement/{name}/{self.sweep_name}/resistance"))
+        except KeyError:
+            return np.nan
+        return zero_bias_conductance(resistance)
+
     def name_generator(
         self,
         gate_voltage=None,
@@ -197,6 +284,12 @@ class MeasurementScript_v2():
             string += f' heater_{heater_power*1e6:09.3f}muW'
         return string
 
+    def wait_for_magnet(self, ramp_cool_down):
+        holding, ramp_time = wait_until_holding(self.gw.magnet, timeout=self.ramp_timeout)
+        self.ramp_times.append((self.study, ramp_time, holding))
+        sleep(ramp_cool_down)
+        return holding
+
     def setup_magnet(self, magnetic_field, ramp_cool_down):
         self.gw.magnet.set_rate(self.magnet_rate)
         if ramp_cool_down is None:
@@ -205,15 +298,57 @@ class MeasurementScript_v2():
             self.gw.magnet.set_target_field(magnetic_field) # magnet takes T
             self.gw.magnet.ramp()
             self.gw.magnet.ramp()
-            sleep(ramp_cool_down)      
+            self.wait_for_magnet(ramp_cool_down)
         else:
             self.gw.magnet.set_target_field(0) 
             self.gw.magnet.ramp() 
             self.gw.magnet.ramp()
             magnetic_field = 0
+        self.parameters['magnetic_field'] = magnetic_field
         return magnetic_field
     
+    def wait_for_temperature(self, start, min_time):
+        if self.heater_settle_predict:
+            detector = EquilibriumEstimator(
+                tolerance=self.heater_settle_drift,
+                horizon=self.offset_time + self.sweep_time,
+                noise=self.heater_settle_noise,
+            )
+        else:
+            detector = StabilityDetector(
+                window=self.heater_settle_window,
+                drift=self.heater_settle_drift,
+                noise=self.heater_settle_noise,
+            )
+        # rows of T_SAMPLE_PATH, get_data of the driver would take the samples of a measurement
+        try:
+            self.temperature_row = self.dgw.get(T_SAMPLE_PATH).shape[0]
+        except KeyError:
+            self.temperature_row = 0
+        stable, settle_time = wait_until_stable(
+            self.read_temperature,
+            detector,
+            timeout=self.heater_settle_timeout,
+            min_time=min_time,
+            start=start,
+        )
+        self.settle_times.append((self.study, settle_time, stable))
+        if self.heater_settle_predict and detector.records:
+            self.dgw.append(RESIDUALS_PATH, detector.residuals())
+        return stable
+
+    def read_temperature(self):
+        """sample temperatures saved since the last call, like BlueForsAPI.get_data"""
+        try:
+            data = self.dgw.get_data(T_SAMPLE_PATH, slice(self.temperature_row, None))
+        except KeyError:
+            return None
+        self.temperature_row += len(data)
+        if len(data):
+            return {"time": data['time'], "Tsample": data['T']}
+
     def setup_heater(self, manual_value, heater_cool_down):
+        start = time()
         self.gw.bluefors.setRange(6)
         if manual_value is not None:
             self.gw.bluefors.setManualValue(manual_value)
@@ -222,7 +357,11 @@ class MeasurementScript_v2():
             manual_value = np.nan
         if heater_cool_down is None:
             heater_cool_down = self.heater_cool_down
-        sleep(heater_cool_down)
+        if self.heater_settle:
+            self.wait_for_temperature(start, heater_cool_down)
+        else:
+            sleep(heater_cool_down)
+        self.parameters['heater_power'] = manual_value
         return manual_value
     
     def setup_gate(self, gate_voltage):
@@ -231,6 +370,7 @@ class MeasurementScript_v2():
             self.gw.gate.setOutput(True)
         else:
             gate_voltage = np.nan
+        self.parameters['gate_voltage'] = gate_voltage
         return gate_voltage
     
     def setup_vna(self, vna_frequency, vna_amplitude):
@@ -240,6 +380,8 @@ class MeasurementScript_v2():
             self.gw.vna.setOutput(True)
         else:
             vna_frequency, vna_amplitude = np.nan, np.nan 
+        self.parameters['vna_frequency'] = vna_frequency
+        self.parameters['vna_amplitude'] = vna_amplitude
         return vna_frequency, vna_amplitude
     
     def setup_femtos(self, femto1_amp, femto2_amp):
@@ -249,11 +391,14 @@ class MeasurementScript_v2():
             femto2_amp = self.femto2_amp  
         self.gw.femto.set_amp(femto1_amp, 'A')
         self.gw.femto.set_amp(femto2_amp, 'B')
+        self.parameters['femto1_amp'] = femto1_amp
+        self.parameters['femto2_amp'] = femto2_amp
 
     def setup_adwin(self, sample_rate): 
         if sample_rate is None:
             sample_rate = self.adwin_sample_rate  
         self.gw.adwin.setSampleRate(sample_rate)
+        self.parameters['sample_rate'] = sample_rate
 
     def measure_IV(self, name, amplitude, period, offset_time, sweep_time):        
         if amplitude is None:
@@ -285,6 +430,16 @@ class MeasurementScript_v2():
         self.gw.adwin.setOutput(True)
         sleep(sweep_time)
         m.stop()
+
+        self.dgw.append(CATALOG_PATH, catalog_row(
+            name,
+            study=self.study,
+            amplitude=amplitude,
+            period=period,
+            offset_time=offset_time,
+            sweep_time=sweep_time,
+            **self.parameters,
+            ))
         sleep(self.sweep_cool_down)
 
     """
@@ -316,6 +471,7 @@ class MeasurementScript_v2():
             vna_frequency=vna_frequency, 
             magnetic_field=magnetic_field,
             )
+        self.begin_study(iv_name)
         
         # setup general stuff
         self.setup_adwin(sample_rate)
@@ -349,6 +505,7 @@ class MeasurementScript_v2():
             magnetic_field = None,
             vna_amplitude = None,
             vna_frequency = None,  
+            budget = None,
                         ):
 
         # Genereate Name
@@ -359,6 +516,7 @@ class MeasurementScript_v2():
             vna_frequency=vna_frequency, 
             magnetic_field=magnetic_field,
             )  
+        self.begin_study(gate_voltages_name)
         
         # setup general stuff
         self.setup_adwin(sample_rate)
@@ -378,7 +536,19 @@ class MeasurementScript_v2():
             sweep_time=sweep_time
             )
         
-        for _, gate_voltage in enumerate(tqdm(gate_voltages)):
+        # gate_voltages, then refinements up to budget IVs
+        sampler = AdaptiveSampler(
+            gate_voltages, 
+            budget, 
+            min_step=self.gate_resolution, 
+            batch=self.adaptive_batch,
+            )
+        if sampler.refining:
+            # resistance for the zero bias conductance
+            calculating = self.gw.adwin.getCalculating()
+            self.gw.adwin.setCalculating(True)
+
+        for _, gate_voltage in enumerate(tqdm(sampler)):
             fname = self.name_generator(gate_voltage=gate_voltage)[1:]
             
             # ramp to field
@@ -393,7 +563,11 @@ class MeasurementScript_v2():
                 sweep_time=sweep_time
                 )
             self.gw.gate.setOutput(False)
+            if sampler.refining:
+                sampler.tell(gate_voltage, self.zero_bias_conductance(f"{gate_voltages_name}/{fname}"))
 
+        if sampler.refining:
+            self.gw.adwin.setCalculating(calculating)
         self.save_state()
 
     def magnetic_field_study(
@@ -410,6 +584,8 @@ class MeasurementScript_v2():
             gate_voltage = None,
             vna_amplitude = None,
             vna_frequency = None,  
+            order = None,
+            budget = None,
                         ):
         
         # Genereate Name
@@ -420,6 +596,7 @@ class MeasurementScript_v2():
             vna_amplitude=vna_amplitude, 
             vna_frequency=vna_frequency, 
             )
+        self.begin_study(magnetic_fields_name)
         
         # setup general stuff
         self.setup_adwin(sample_rate)
@@ -439,10 +616,34 @@ class MeasurementScript_v2():
             sweep_time=sweep_time
             )
         
-        # Ramp to initial field and wait initial_ramp_cool_down s
+        # order of the fields, 'monotonic' for one pass without hysteresis
+        field = float(self.gw.magnet.get_field())
+        points = self.plan_study(
+            {'magnetic_field': magnetic_fields},
+            order,
+            start={'magnetic_field': field} if np.isfinite(field) else None,
+            offset_time=offset_time,
+            sweep_time=sweep_time,
+            monotonic='magnetic_field',
+            )
+        magnetic_fields = [point['magnetic_field'] for point in points]
+
+        # Ramp to initial field, wait until holding and initial_ramp_cool_down s
         magnetic_field = self.setup_magnet(magnetic_fields[0], self.initial_ramp_cool_down)
+
+        # magnetic_fields, then refinements up to budget IVs
+        sampler = AdaptiveSampler(
+            magnetic_fields, 
+            budget, 
+            min_step=self.field_resolution, 
+            batch=self.adaptive_batch,
+            )
+        if sampler.refining:
+            # resistance for the zero bias conductance
+            calculating = self.gw.adwin.getCalculating()
+            self.gw.adwin.setCalculating(True)
         
-        for _, magnetic_field in enumerate(tqdm(magnetic_fields)):
+        for _, magnetic_field in enumerate(tqdm(sampler)):
             fname = self.name_generator(magnetic_field=magnetic_field)[1:]
             
             # ramp to field
@@ -456,9 +657,13 @@ class MeasurementScript_v2():
                 offset_time=offset_time, 
                 sweep_time=sweep_time
                 )
+            if sampler.refining:
+                sampler.tell(magnetic_field, self.zero_bias_conductance(f"{magnetic_fields_name}/{fname}"))
 
+        if sampler.refining:
+            self.gw.adwin.setCalculating(calculating)
         self.save_state()
-        sleep(self.initial_ramp_cool_down)
+        self.wait_for_magnet(self.initial_ramp_cool_down)
 
     def irradiation_study(
             self,
@@ -474,6 +679,7 @@ class MeasurementScript_v2():
             femto2_amp = None,
             gate_voltage = None,
             magnetic_field = None, 
+            order = None,
                              ):
 
         # Generate Name
@@ -483,6 +689,7 @@ class MeasurementScript_v2():
             gate_voltage=gate_voltage, 
             magnetic_field=magnetic_field,
             )      
+        self.begin_study(vna_irradiations_name)
                 
         # setup general stuff
         self.setup_adwin(sample_rate)
@@ -502,8 +709,14 @@ class MeasurementScript_v2():
             sweep_time=sweep_time
             )
         
-        for vna_frequency, vna_amplitude in product(vna_frequencies, vna_amplitudes):
-            vna_frequency, vna_amplitude = float(vna_frequency), float(vna_amplitude)
+        points = self.plan_study(
+            {'vna_frequency': vna_frequencies, 'vna_amplitude': vna_amplitudes},
+            order,
+            offset_time=offset_time,
+            sweep_time=sweep_time,
+            )
+        for point in tqdm(points):
+            vna_frequency, vna_amplitude = float(point['vna_frequency']), float(point['vna_amplitude'])
             
             fname = self.name_generator(
                 vna_frequency=vna_frequency,
@@ -612,6 +825,7 @@ class MeasurementScript_v2():
             magnetic_field = None,
             vna_amplitude = None,
             vna_frequency = None,  
+            order = None,
                         ):
         
         # Genereate Name
@@ -623,6 +837,7 @@ class MeasurementScript_v2():
             vna_amplitude=vna_amplitude, 
             vna_frequency=vna_frequency, 
             )
+        self.begin_study(temperatures_name)
         
         # setup general stuff
         self.setup_adwin(sample_rate)
@@ -653,12 +868,19 @@ class MeasurementScript_v2():
         
         # Ramp to initial temperature
         heater_powers = np.exp(2.479 * np.log(temperatures * 0.06515603))
+        points = self.plan_study(
+            {'heater_power': heater_powers},
+            order,
+            start={'heater_power': 0.},
+            offset_time=offset_time,
+            sweep_time=sweep_time,
+            )
+        heater_powers = np.array([point['heater_power'] for point in points])
         if relaxation_turns is not None:
             zero_turns = np.zeros(relaxation_turns)
             heater_powers = np.concatenate((heater_powers, zero_turns))
 
-        _ = self.setup_heater(heater_powers[0], self.heater_cool_down)
-        
+        # the first setup_heater of the loop ramps to the initial temperature
         index = 0
         for _, heater_power in enumerate(tqdm(heater_powers)):
             fname = self.name_generator(heater_power=heater_power)[1:]
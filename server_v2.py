@@ -58,6 +58,9 @@ sys.path.append('C:\\Users\\BlueFors\\Documents')
 from p5control import InstrumentServer, inserv_cli
 from p5control.server.inserv import InstrumentServerError
 
+from core.utilities.hdf5safe import recover, FlushCheckpointer
+from core.utilities.segments import SegmentIndex, Rollover
+
 """
 Device drivers
 """
@@ -81,7 +84,13 @@ from core.drivers_v2.keysight34461A_RT import Keysight34461A_thermometer as RT_t
 Initialize Instrument Server
 """
 # inserv = InstrumentServer()
-inserv = InstrumentServer(data_server_filename='OI-25d-10 2025-06-17 breaking 0.hdf5')
+data_server_filename = 'OI-25d-10 2025-06-17 breaking 0.hdf5'
+# continue in the last segment of this file, see rollover below
+segment_index = SegmentIndex(data_server_filename)
+data_server_filename = segment_index.current()
+# clears the consistency flags a crash left in the file (h5clear -s)
+recover(data_server_filename)
+inserv = InstrumentServer(data_server_filename=data_server_filename)
 
 """
 Add Devices
@@ -110,8 +119,19 @@ print("Added instruments successfully.")
 
 inserv.start()
 
+# a crash loses at most the last 10s of data
+checkpointer = FlushCheckpointer(inserv, interval=10)
+checkpointer.start()
+
+# new segment file every 2GB or day, listed in the .index.json next to the file
+rollover = Rollover(inserv, segment_index, max_size=2e9, interval=24*3600)
+rollover.start()
+
 inserv_cli(inserv)
 
+rollover.stop()
+checkpointer.stop()
+
 """
 Close Instrument Server
 """
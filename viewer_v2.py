@@ -44,6 +44,13 @@ from p5control.gui import (
     PlotTabWidget,
 )
 
+# plot configs of core.plot, e.g. pyramid levels of long datasets
+import core.plot
+
+# read flushed rows from the data server file on this PC instead of through rpyc, needs the
+# FlushCheckpointer of server_v2.py
+LOCAL_READS = False
+
 class BlueForsGUIMainWindow(QMainWindow):
     
     def __init__(
@@ -151,7 +158,7 @@ class BlueForsGUIMainWindow(QMainWindow):
         self.tabs.currentWidget().update()
         
 if __name__ == '__main__':
-    with GuiDataGateway(allow_callback=True) as dgw, InstrumentGateway() as gw:
+    with core.plot.LocalDataGateway(allow_callback=True, local=LOCAL_READS) as dgw, InstrumentGateway() as gw:
 
         app = CleanupApp()
         app.setOrganizationName('P5-Control-Team')